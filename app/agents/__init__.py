@@ -1,20 +1,62 @@
-"""PatentFinder Agents module"""
+"""PatentFinder Agents module
+
+strandsに依存するLLMエージェント（Planner / Requirements Examinator / Fact Checker）は
+初回アクセス時に読み込む。cascade・cache・payloads等の軽量なモジュールは
+strandsがインストールされていない環境（テスト等）でもインポートできる。
+"""
+import importlib
 import sys
 from pathlib import Path
 
 # プロンプトモジュールへのパスを追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from .planner import plan_and_coordinate
 from .sketch_extractor import extract_markush_structure
 from .substituents_matcher import match_substituents
-from .examinator import examine_requirements
-from .fact_checker import check_facts
+from .verdicts import (
+    ExaminationVerdict,
+    FactCheckVerdict,
+    InfringementReport,
+    VerifiedReport,
+    GroupVerdict,
+    render_examination_markdown,
+    render_fact_check_markdown,
+    render_report_markdown,
+    examination_is_protected
+)
 
 __all__ = [
     "plan_and_coordinate",
+    "verify_and_report",
     "extract_markush_structure",
     "match_substituents",
     "examine_requirements",
-    "check_facts"
+    "examine_requirements_batch",
+    "examine_requirements_per_group",
+    "check_facts",
+    "ExaminationVerdict",
+    "FactCheckVerdict",
+    "InfringementReport",
+    "VerifiedReport",
+    "GroupVerdict",
+    "render_examination_markdown",
+    "render_fact_check_markdown",
+    "render_report_markdown",
+    "examination_is_protected"
 ]
+
+# 名前 → 定義しているLLMエージェントのモジュール（初回アクセス時に読み込む）
+_LAZY_EXPORTS = {
+    "plan_and_coordinate": ".planner",
+    "verify_and_report": ".planner",
+    "examine_requirements": ".examinator",
+    "examine_requirements_batch": ".examinator",
+    "examine_requirements_per_group": ".examinator",
+    "check_facts": ".fact_checker",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        return getattr(importlib.import_module(_LAZY_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
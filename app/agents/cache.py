@@ -0,0 +1,238 @@
+"""共有キャッシュ - 水平スケールしたレプリカ間でSketch Extractor / Matcher / LLM応答を再利用
+
+バックエンドは環境変数CACHE_BACKENDで選択する:
+
+- ``none``（既定）: キャッシュしない
+- ``sqlite``: 共有ボリューム上のSQLiteファイル（CACHE_PATH）。全レプリカが同じファイルを参照する
+
+SQLiteバックエンドは書き込みをトランザクションで行い（アトミック）、TTL（CACHE_TTL_SEC）と
+合計サイズ上限（CACHE_MAX_BYTES、超過時は最終アクセスの古い順に削除）をサポートする。
+読み出しは書き込みロックを取らないSELECTのみで行い、ヒット・ミスの集計と最終アクセス時刻の更新は
+プロセス内に溜めてCACHE_STATS_FLUSH_SEC秒ごと（および書き込み時）にまとめてDBへ反映する。
+ヒット・ミスはレプリカ（CACHE_REPLICA_ID、既定はホスト名）ごとに記録し、
+他のレプリカが書き込んだエントリへのヒットは共有ヒットとして別に数える。
+
+SQLiteはWALモードで開くため、共有メモリ（-shmファイル）を使う。全レプリカが同じホスト上で
+同じボリュームをマウントしている場合にのみ使え、NFS・SMB等のネットワークファイルシステムでは
+ロックが正しく働かない。
+"""
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from .cancellation import check_cancelled
+from .verdicts import decode_output, encode_output
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "none")
+CACHE_PATH = os.getenv("CACHE_PATH", ".cache/patentfinder.sqlite")
+CACHE_TTL_SEC = float(os.getenv("CACHE_TTL_SEC", "86400"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+CACHE_REPLICA_ID = os.getenv("CACHE_REPLICA_ID") or socket.gethostname()
+CACHE_STATS_FLUSH_SEC = float(os.getenv("CACHE_STATS_FLUSH_SEC", "30"))
+
+
+def cache_key(namespace: str, *parts: Any) -> str:
+    """名前空間と入力から決まるキャッシュキー"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+class NullCache:
+    """キャッシュしないバックエンド"""
+
+    def get(self, key: str) -> Optional[Any]:
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        pass
+
+    def stats(self) -> list[dict]:
+        return []
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        return compute()
+
+
+class SQLiteCache(NullCache):
+    """共有ボリューム上のSQLiteファイルを使うキャッシュ"""
+
+    def __init__(
+        self,
+        path: str = CACHE_PATH,
+        ttl: float = CACHE_TTL_SEC,
+        max_bytes: int = CACHE_MAX_BYTES,
+        replica_id: str = CACHE_REPLICA_ID,
+        flush_interval: float = CACHE_STATS_FLUSH_SEC
+    ):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.replica_id = replica_id
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        # DBへ未反映のヒット・ミス数と最終アクセス時刻
+        self._pending_lock = threading.Lock()
+        self._pending_counts = {"hits": 0, "shared_hits": 0, "misses": 0}
+        self._pending_access: dict[str, float] = {}
+        self._last_flush = time.monotonic()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, writer TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS replica_stats ("
+                "replica TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, "
+                "shared_hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 自動コミットモードで接続し、トランザクションは_transactionで明示的に張る
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._conn()
+
+        class _Tx:
+            def __enter__(self_inner):
+                conn.execute("BEGIN IMMEDIATE")
+                return conn
+
+            def __exit__(self_inner, exc_type, exc, tb):
+                conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return _Tx()
+
+    def _record(self, key: str, now: float, writer: Optional[str]) -> None:
+        """ヒット・ミスをプロセス内に記録し、前回の反映からflush_interval秒経っていればDBへ反映"""
+        with self._pending_lock:
+            if writer is None:
+                self._pending_counts["misses"] += 1
+            else:
+                self._pending_counts["hits"] += 1
+                if writer != self.replica_id:
+                    self._pending_counts["shared_hits"] += 1
+                self._pending_access[key] = now
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            with self._transaction() as conn:
+                self._flush(conn)
+
+    def _flush(self, conn: sqlite3.Connection) -> None:
+        """溜めたヒット・ミス数と最終アクセス時刻をまとめてDBへ反映（トランザクション内で呼ぶ）"""
+        with self._pending_lock:
+            counts, self._pending_counts = self._pending_counts, dict.fromkeys(self._pending_counts, 0)
+            accessed, self._pending_access = self._pending_access, {}
+            self._last_flush = time.monotonic()
+        if any(counts.values()):
+            conn.execute(
+                "INSERT INTO replica_stats (replica, hits, shared_hits, misses) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(replica) DO UPDATE SET hits = hits + excluded.hits, "
+                "shared_hits = shared_hits + excluded.shared_hits, misses = misses + excluded.misses",
+                (self.replica_id, counts["hits"], counts["shared_hits"], counts["misses"])
+            )
+        if accessed:
+            conn.executemany(
+                "UPDATE entries SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(at, key) for key, at in accessed.items()]
+            )
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value, writer FROM entries WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        self._record(key, now, None if row is None else row[1])
+        if row is None:
+            return None
+        return decode_output(json.loads(row[0]))
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        data = json.dumps(encode_output(value), ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, writer, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, data, size, self.replica_id, now + (ttl or self.ttl), now)
+            )
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            # 最終アクセス時刻を反映してから古い順に削除する
+            self._flush(conn)
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """合計サイズが上限を超えた分を最終アクセスの古い順に削除"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        check_cancelled()
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def stats(self) -> list[dict]:
+        """レプリカごとのヒット率（全レプリカ分）"""
+        with self._transaction() as conn:
+            self._flush(conn)
+        rows = self._conn().execute(
+            "SELECT replica, hits, shared_hits, misses FROM replica_stats ORDER BY replica"
+        ).fetchall()
+        return [
+            {
+                "replica": replica,
+                "hits": hits,
+                "shared_hits": shared_hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            }
+            for replica, hits, shared_hits, misses in rows
+        ]
+
+
+_BACKENDS = {"none": NullCache, "sqlite": SQLiteCache}
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def use_cache(cache: Optional[NullCache]) -> None:
+    """以降の呼び出しで使うキャッシュを差し替える（NoneでCACHE_BACKENDの設定に戻す）"""
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+def get_cache() -> NullCache:
+    """CACHE_BACKENDで選択したキャッシュを取得（プロセス内で共有）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = _BACKENDS[CACHE_BACKEND]()
+        return _cache
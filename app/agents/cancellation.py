@@ -0,0 +1,108 @@
+"""キャンセルと期限の伝搬 - 評価ごとのキャンセルトークン
+
+トークンはContextVarで呼び出し階層に伝搬し、match_substituentsの各ステップと
+全てのLLM呼び出し（invoke_agent）で確認される。LLM呼び出し中にキャンセル・期限切れになった場合は
+実行中のリクエストを中断する。スレッドプールに処理を渡すときはsubmit_with_contextで
+コンテキストごと引き継ぐ。
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+
+class AssessmentCancelled(Exception):
+    """評価がキャンセルされた"""
+
+
+class DeadlineExceeded(AssessmentCancelled):
+    """評価またはステージの期限を超過した"""
+
+
+class CancellationToken:
+    """キャンセル要求と期限を保持するトークン
+
+    子トークンは親のキャンセルを引き継ぎ、期限は親と自身の早い方になる。
+    子トークンのキャンセルは親や兄弟に影響しない。
+    cancel_whenを指定すると、確認のたびに呼び出し、Trueを返した時点でキャンセル扱いにする
+    （例: UIセッションの切断や再実行要求の検知）。
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        parent: Optional["CancellationToken"] = None,
+        cancel_when: Optional[Callable[[], bool]] = None
+    ):
+        self._event = threading.Event()
+        self._reason = "cancelled"
+        self._cancel_when = cancel_when
+        self.parent = parent
+        deadlines = [time.monotonic() + timeout] if timeout is not None else []
+        if parent is not None and parent.deadline is not None:
+            deadlines.append(parent.deadline)
+        self.deadline: Optional[float] = min(deadlines) if deadlines else None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        self._reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self._cancel_when is not None and self._cancel_when():
+            self.cancel("abandoned")
+        return self._event.is_set() or (self.parent is not None and self.parent.cancelled)
+
+    @property
+    def reason(self) -> str:
+        if self._event.is_set() or self.parent is None:
+            return self._reason
+        return self.parent.reason
+
+    def remaining(self) -> Optional[float]:
+        """期限までの残り秒数（期限なしはNone）"""
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def check(self) -> None:
+        """キャンセル済み、または期限切れなら例外を送出"""
+        if self.cancelled:
+            raise AssessmentCancelled(self.reason)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("deadline exceeded")
+
+    def child(self, timeout: Optional[float] = None) -> "CancellationToken":
+        return CancellationToken(timeout, parent=self)
+
+
+_current: contextvars.ContextVar[Optional[CancellationToken]] = contextvars.ContextVar(
+    "cancellation_token", default=None
+)
+
+
+def current_token() -> Optional[CancellationToken]:
+    return _current.get()
+
+
+def check_cancelled() -> None:
+    """現在のトークンがキャンセル済み・期限切れなら例外を送出（トークンがなければ何もしない）"""
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+@contextmanager
+def use_token(token: Optional[CancellationToken]):
+    """ブロック内の処理に伝搬するトークンを設定"""
+    reset = _current.set(token)
+    try:
+        yield token
+    finally:
+        _current.reset(reset)
+
+
+def submit_with_context(executor: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """現在のコンテキスト（トークン・使用量の記録先）を引き継いでスレッドプールに投入"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
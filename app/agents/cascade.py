@@ -0,0 +1,247 @@
+"""モデルカスケード - 小型モデルで先に実行し、必要な場合のみ強いモデルへ昇格
+
+昇格条件:
+- 構造化出力の確信度が閾値未満
+- Substituents MatcherのRDKit / NN両ブランチの結果が不一致
+- Fact Checkerが不整合を検出
+
+ステージごとに昇格率と、全呼び出しを強いモデルで実行した場合と比べた
+レイテンシ・コストの削減量を記録し、閾値調整に使えるようにする。
+"""
+import os
+import threading
+import warnings
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Sequence
+
+from .llm import get_model_id, track_usage
+
+SMALL_TIER = "small"
+STRONG_TIER = "strong"
+
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", "0.8"))
+
+# 強いモデルの観測がない間、強いモデルの1回あたりのレイテンシを小型モデルの何倍と見積もるか
+CASCADE_STRONG_LATENCY_RATIO = float(os.getenv("CASCADE_STRONG_LATENCY_RATIO", "3.0"))
+
+# 1,000トークンあたりのコスト（入出力合算、USD）
+MODEL_COST_PER_1K_TOKENS = {
+    SMALL_TIER: float(os.getenv("SMALL_MODEL_COST_PER_1K_TOKENS", "0.001")),
+    STRONG_TIER: float(os.getenv("STRONG_MODEL_COST_PER_1K_TOKENS", "0.015")),
+}
+
+
+def _tokens(usage: dict) -> int:
+    return usage["input_tokens"] + usage["output_tokens"]
+
+
+def _cost(usage: dict, tier: str) -> float:
+    return _tokens(usage) / 1000 * MODEL_COST_PER_1K_TOKENS[tier]
+
+
+@dataclass
+class StageCascadeStats:
+    """1ステージ分のカスケード統計"""
+    calls: int = 0
+    small_calls: int = 0
+    strong_calls: int = 0
+    escalations: int = 0
+    small_latency: float = 0.0
+    strong_latency: float = 0.0
+    small_cost: float = 0.0
+    strong_cost: float = 0.0
+    # 昇格しなかった呼び出しを強いモデルで実行した場合の推定コスト
+    avoided_strong_cost: float = 0.0
+    # 全呼び出しを強いモデルで実行していれば不要だった強いモデルの追加呼び出しのコスト
+    extra_strong_cost: float = 0.0
+
+    @property
+    def escalation_rate(self) -> float:
+        return self.escalations / self.calls if self.calls else 0.0
+
+    @property
+    def cost_saved(self) -> float:
+        # 昇格した呼び出しでは小型モデルのコストがそのまま上乗せになる
+        return self.avoided_strong_cost - self.small_cost - self.extra_strong_cost
+
+    @property
+    def strong_latency_per_call(self) -> Optional[float]:
+        """強いモデル1回あたりのレイテンシ（未観測なら小型モデルの平均×CASCADE_STRONG_LATENCY_RATIO）"""
+        if self.strong_calls:
+            return self.strong_latency / self.strong_calls
+        if self.small_calls:
+            return self.small_latency / self.small_calls * CASCADE_STRONG_LATENCY_RATIO
+        return None
+
+    @property
+    def latency_saved(self) -> Optional[float]:
+        """全呼び出しを強いモデルで実行した場合との差（呼び出しがなければNone）"""
+        per_call = self.strong_latency_per_call
+        if per_call is None:
+            return None
+        return self.calls * per_call - (self.small_latency + self.strong_latency)
+
+
+class CascadeStats:
+    """ステージ別のカスケード統計（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: dict[str, StageCascadeStats] = {}
+
+    def record(self, stage: str, small: Optional[dict] = None, strong: Optional[dict] = None) -> None:
+        """1回のカスケード実行結果を記録
+
+        Args:
+            stage: ステージ名
+            small: 小型モデル呼び出しの使用量（track_usageの結果、最初から強いモデルで実行した場合はNone）
+            strong: 強いモデル呼び出しの使用量（昇格しなかった場合はNone）
+        """
+        with self._lock:
+            stats = self._stages.setdefault(stage, StageCascadeStats())
+            stats.calls += 1
+            if small is not None:
+                stats.small_calls += 1
+                stats.small_latency += small["latency"]
+                stats.small_cost += _cost(small, SMALL_TIER)
+                if strong is None:
+                    stats.avoided_strong_cost += _cost(small, STRONG_TIER)
+            if strong is not None:
+                stats.escalations += 1
+                self._add_strong(stats, strong)
+
+    def record_late_escalation(self, stage: str, strong: dict, accepted_small: Optional[dict] = None) -> None:
+        """採用済みの小型モデルの結果を、後から強いモデルで再実行した分を記録
+
+        Args:
+            stage: ステージ名
+            strong: 強いモデル呼び出しの使用量
+            accepted_small: 採用時に記録した小型モデル呼び出しの使用量（この呼び出しで見込んだ削減を取り消す。
+                チェックポイントや前回の評価から復元した結果で、削減を記録していない場合はNone）
+        """
+        with self._lock:
+            stats = self._stages.setdefault(stage, StageCascadeStats())
+            stats.escalations += 1
+            if accepted_small is not None:
+                stats.avoided_strong_cost -= _cost(accepted_small, STRONG_TIER)
+            else:
+                # 記録のない呼び出しは、最初から強いモデルで実行した1回として数える
+                stats.calls += 1
+            self._add_strong(stats, strong)
+
+    def record_extra_strong(self, stage: str, strong: dict) -> None:
+        """全呼び出しを強いモデルで実行していれば不要だった強いモデルの追加呼び出しを記録"""
+        with self._lock:
+            stats = self._stages.setdefault(stage, StageCascadeStats())
+            self._add_strong(stats, strong)
+            stats.extra_strong_cost += _cost(strong, STRONG_TIER)
+
+    @staticmethod
+    def _add_strong(stats: StageCascadeStats, strong: dict) -> None:
+        stats.strong_calls += 1
+        stats.strong_latency += strong["latency"]
+        stats.strong_cost += _cost(strong, STRONG_TIER)
+
+    def summary(self) -> list[dict]:
+        """ステージ別の統計を表示用の辞書リストで返す"""
+        with self._lock:
+            return [
+                {
+                    "stage": stage,
+                    "calls": stats.calls,
+                    "escalations": stats.escalations,
+                    "escalation_rate": round(stats.escalation_rate, 3),
+                    "latency_saved_sec": None if stats.latency_saved is None else round(stats.latency_saved, 2),
+                    # 強いモデルのレイテンシが観測値ではなく比率からの推定か
+                    "latency_estimated": not stats.strong_calls,
+                    "cost_saved_usd": round(stats.cost_saved, 5),
+                }
+                for stage, stats in self._stages.items()
+            ]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+
+
+CASCADE_STATS = CascadeStats()
+
+
+def low_confidence(verdict: Any, threshold: float = CASCADE_CONFIDENCE_THRESHOLD) -> bool:
+    """構造化出力の確信度が閾値未満か"""
+    return getattr(verdict, "confidence", 0.0) < threshold
+
+
+def matcher_branches_disagree(matcher_result: dict) -> bool:
+    """RDKitとMarkushMatcher（NN）の結果が一致しないか
+
+    R基ごとの一致はSubstituents Matcherのbranches_agreeで判定する（フラグのない結果は不一致とみなす）。
+    """
+    rdkit_result = matcher_result.get("rdkit_result", {})
+    nn_result = matcher_result.get("nn_result", {})
+    if rdkit_result.get("skeleton_match") != nn_result.get("skeleton_match"):
+        return True
+    return any(not item.get("branches_agree", False) for item in matcher_result.get("substituent_analysis", []))
+
+
+_warned_same_model: set[str] = set()
+
+
+def cascade_enabled(stage: str) -> bool:
+    """小型・強いモデルが別のモデルIDに解決されるか（同じなら一度だけ警告してカスケードを無効化）"""
+    if get_model_id(stage, SMALL_TIER) != get_model_id(stage, STRONG_TIER):
+        return True
+    if stage not in _warned_same_model:
+        _warned_same_model.add(stage)
+        warnings.warn(
+            f"{stage}: 小型モデルと強いモデルのモデルIDが同じため、カスケードを無効にします"
+            f"（{get_model_id(stage, SMALL_TIER)}）",
+            stacklevel=3
+        )
+    return False
+
+
+def run_cascade(
+    stage: str,
+    call: Callable[[str], Any],
+    escalation_reasons: Callable[[Any], list[str]],
+    stats: CascadeStats = CASCADE_STATS,
+    known_reasons: Sequence[str] = (),
+    accepted_usage: Optional[dict] = None
+) -> tuple[Any, list[str]]:
+    """小型モデルで実行し、昇格条件に該当すれば強いモデルで再実行
+
+    Args:
+        stage: ステージ名（統計の集計キー）
+        call: モデルティアを受け取りステージを実行する関数
+        escalation_reasons: 小型モデルの結果から昇格理由のリストを返す関数（空なら昇格しない）
+        stats: 記録先の統計
+        known_reasons: LLM呼び出し前に判明している昇格理由（あれば小型モデルを実行せず強いモデルで実行）
+        accepted_usage: 指定した場合、小型モデルの結果を採用したときにその使用量を書き込む
+            （後から昇格した場合にrecord_late_escalationへ渡す）
+
+    Returns:
+        (最終結果, 昇格理由のリスト)
+    """
+    if not cascade_enabled(stage):
+        return call(STRONG_TIER), []
+
+    if known_reasons:
+        with track_usage() as strong:
+            result = call(STRONG_TIER)
+        stats.record(stage, strong=strong)
+        return result, list(known_reasons)
+
+    with track_usage() as small:
+        result = call(SMALL_TIER)
+    reasons = escalation_reasons(result)
+    if not reasons:
+        stats.record(stage, small=small)
+        if accepted_usage is not None:
+            accepted_usage.update(small)
+        return result, []
+
+    with track_usage() as strong:
+        result = call(STRONG_TIER)
+    stats.record(stage, small=small, strong=strong)
+    return result, reasons
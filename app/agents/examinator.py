@@ -6,20 +6,53 @@ meets the patent's substituent group requirements
 論文の設定: OpenAI-o1をtemperature=1.0で使用（推論を促進するため）
 """
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional, Union
+
+from pydantic import ValidationError
 from strands import Agent
+from strands.types.exceptions import MaxTokensReachedException, StructuredOutputException
 from prompts import EXTENDED_SMILES_DEFINITION, REQUIREMENTS_EXAMINATOR_PROMPT_TEMPLATE
 
-MODEL_ID = os.getenv("MODEL_ID", "jp.anthropic.claude-haiku-4-5-20251001-v1:0")
+from .cancellation import CancellationToken, current_token, submit_with_context, use_token
+from .llm import STRUCTURED_MAX_TOKENS, create_model, estimate_tokens, invoke_agent
+from .payloads import (
+    format_group_id,
+    format_mapping,
+    format_requirement,
+    format_smiles,
+    short_group_id
+)
+from .verdicts import (
+    BatchExaminationVerdict,
+    ExaminationVerdict,
+    GroupExamination,
+    aggregate_group_examinations
+)
+
+STAGE = "examinator"
+
+# R基ごとの並列評価の同時実行数と、1R基あたりの出力トークン上限
+GROUP_WORKERS = int(os.getenv("EXAMINATOR_GROUP_WORKERS", "8"))
+GROUP_MAX_TOKENS = int(os.getenv("EXAMINATOR_GROUP_MAX_TOKENS", "384"))
+
+# バッチ評価: 1回のプロンプトの入力トークン予算と、1分子あたりの出力トークン見積もり
+BATCH_INPUT_TOKEN_BUDGET = int(os.getenv("EXAMINATOR_BATCH_INPUT_TOKEN_BUDGET", "16000"))
+BATCH_OUTPUT_TOKENS_PER_ITEM = int(os.getenv("EXAMINATOR_BATCH_OUTPUT_TOKENS_PER_ITEM", "400"))
+BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("EXAMINATOR_BATCH_MAX_OUTPUT_TOKENS", "8192"))
+
+# 構造化出力を解析できなかったときの例外（スキーマ不一致、ツール呼び出しなしの応答、出力トークン上限での打ち切り）
+STRUCTURED_OUTPUT_ERRORS = (ValidationError, ValueError, StructuredOutputException, MaxTokensReachedException)
 
 # 論文Appendix Aに基づくプロンプト
 EXAMINATOR_PROMPT = REQUIREMENTS_EXAMINATOR_PROMPT_TEMPLATE.format(
     extended_smiles_definition=EXTENDED_SMILES_DEFINITION
 )
 
-def create_examinator_agent() -> Agent:
+def create_examinator_agent(max_tokens: Optional[int] = None, tier: Optional[str] = None) -> Agent:
     """Requirements Examinatorエージェントを作成"""
     return Agent(
-        model=MODEL_ID,
+        model=create_model(STAGE, tier, max_tokens),
         system_prompt=EXAMINATOR_PROMPT
     )
 
@@ -27,8 +60,11 @@ def examine_requirements(
     markush_string: str,
     molecule_string: str,
     match_result: dict,
-    claim_text: str
-) -> str:
+    claim_text: str,
+    structured: bool = False,
+    max_tokens: Optional[int] = None,
+    tier: Optional[str] = None
+) -> Union[str, ExaminationVerdict]:
     """置換基グループが特許要件を満たすか検証
     
     Args:
@@ -36,19 +72,36 @@ def examine_requirements(
         molecule_string: クエリ分子のSMILES文字列
         match_result: Substituents Matcherからのマッチング結果
         claim_text: 特許クレームテキスト
+        structured: Trueの場合、ExaminationVerdictを返す構造化出力モード
+        max_tokens: 構造化出力モードの出力トークン上限（省略時はSTRUCTURED_MAX_TOKENS）
+        tier: カスケード実行時のモデルティア（"small" / "strong"）
     
     Returns:
-        検証結果（Markdown形式の文字列）
+        検証結果（Markdown形式の文字列、または構造化モードではExaminationVerdict）
     """
-    agent = create_examinator_agent()
-    r_group_mapping = match_result.get("r_group_mapping", {})
+    prompt = examination_prompt(markush_string, molecule_string, match_result, claim_text, structured)
+    if structured:
+        agent = create_examinator_agent(max_tokens or STRUCTURED_MAX_TOKENS, tier)
+        return invoke_agent(agent, prompt, ExaminationVerdict)
     
+    agent = create_examinator_agent(tier=tier)
+    return invoke_agent(agent, prompt)
+
+
+def examination_prompt(
+    markush_string: str,
+    molecule_string: str,
+    match_result: dict,
+    claim_text: str,
+    structured: bool = False
+) -> str:
+    """examine_requirementsのプロンプトを作成"""
     prompt = f"""以下の情報に基づいて、クエリ分子が特許の保護範囲に含まれるか検証してください:
 
 **Markushクレーム**: '{markush_string}'
 
 **現在のサブ構造マッチング結果:**
-{r_group_mapping}
+{format_mapping(match_result.get("r_group_mapping", {}))}
 
 **クエリ分子**:
 {molecule_string}
@@ -56,7 +109,12 @@ def examine_requirements(
 **クレーム要件テキスト:**
 {claim_text}
 
-各R基について、クレーム要件との適合性を詳細に分析し、最終的な判定を提供してください。
+"""
+    if structured:
+        return prompt + """各R基について適合性を判定し、指定されたスキーマで簡潔に回答してください。
+reasonは1文以内、evidenceには根拠となるクレーム番号（例: Claim 1）のみを列挙してください。
+"""
+    return prompt + """各R基について、クレーム要件との適合性を詳細に分析し、最終的な判定を提供してください。
 出力はMarkdown形式で、見出しや箇条書きを使って読みやすく整形してください。
 
 ## 分析結果
@@ -70,6 +128,236 @@ def examine_requirements(
 ### 判定理由
 （詳細な理由）
 """
+
+
+def _batch_item_text(index: int, molecule_string: str, match_result: dict) -> str:
+    return f"""### 分子 {index}
+**クエリ分子**: {molecule_string}
+**サブ構造マッチング結果**: {format_mapping(match_result.get("r_group_mapping", {}))}
+"""
+
+
+def plan_batches(markush_string: str, items: list[tuple[str, dict]], claim_text: str) -> list[list[int]]:
+    """入力・出力トークン予算に収まるように分子をバッチに分割
+    
+    クレームテキストとシステムプロンプトは全バッチで共通のため、
+    予算から差し引いた残りに入る分子数を1バッチとする。
+    
+    Returns:
+        バッチごとの分子インデックスのリスト
+    """
+    shared = estimate_tokens(EXAMINATOR_PROMPT + markush_string + claim_text)
+    input_budget = max(BATCH_INPUT_TOKEN_BUDGET - shared, 0)
+    max_items = max(BATCH_MAX_OUTPUT_TOKENS // BATCH_OUTPUT_TOKENS_PER_ITEM, 1)
+    
+    batches, current, used = [], [], 0
+    for index, (molecule_string, match_result) in enumerate(items):
+        cost = estimate_tokens(_batch_item_text(index, molecule_string, match_result))
+        if current and (used + cost > input_budget or len(current) >= max_items):
+            batches.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def batch_prompt(markush_string: str, items: list[tuple[str, dict]], indices: list[int], claim_text: str) -> str:
+    """バッチ評価のプロンプトを作成"""
+    molecules = "\n".join(_batch_item_text(i, *items[i]) for i in indices)
+    return f"""以下の{len(indices)}個の分子それぞれについて、特許の保護範囲に含まれるか検証してください:
+
+**Markushクレーム**: '{markush_string}'
+
+**クレーム要件テキスト:**
+{claim_text}
+
+## 分子リスト
+{molecules}
+
+各分子について独立に各R基の適合性を判定し、指定されたスキーマで簡潔に回答してください。
+indexには分子の番号をそのまま記入し、全ての分子について1件ずつ回答してください。
+reasonは1文以内、evidenceには根拠となるクレーム番号（例: Claim 1）のみを列挙してください。
+"""
+
+
+def _examine_batch(
+    markush_string: str,
+    items: list[tuple[str, dict]],
+    indices: list[int],
+    claim_text: str,
+    tier: Optional[str]
+) -> dict[int, ExaminationVerdict]:
+    agent = create_examinator_agent(
+        min(BATCH_OUTPUT_TOKENS_PER_ITEM * len(indices), BATCH_MAX_OUTPUT_TOKENS), tier
+    )
+    prompt = batch_prompt(markush_string, items, indices, claim_text)
+    result = invoke_agent(agent, prompt, BatchExaminationVerdict)
+    expected = set(indices)
+    verdicts = {}
+    for item in result.items:
+        if item.index in expected and item.index not in verdicts:
+            verdicts[item.index] = ExaminationVerdict(**item.model_dump(exclude={"index"}))
+    return verdicts
+
+
+def examine_requirements_batch(
+    markush_string: str,
+    items: list[tuple[str, dict]],
+    claim_text: str,
+    tier: Optional[str] = None
+) -> list[ExaminationVerdict]:
+    """同じクレームに対する複数分子をまとめて検証（バッチ評価）
+    
+    クレームテキストとシステムプロンプトを1回のプロンプトで共有し、トークンを分子間で償却する。
+    バッチサイズはトークン予算に応じて決まり、解析できなかった分子は個別に再評価する。
+    
+    Args:
+        markush_string: Markush構造の拡張SMILES文字列
+        items: (クエリ分子のSMILES文字列, Substituents Matcherの結果) のリスト
+        claim_text: 特許クレームテキスト
+        tier: カスケード実行時のモデルティア（"small" / "strong"）
+    
+    Returns:
+        入力と同じ順序の分子ごとの判定
+    """
+    verdicts: dict[int, ExaminationVerdict] = {}
+    for indices in plan_batches(markush_string, items, claim_text):
+        try:
+            verdicts.update(_examine_batch(markush_string, items, indices, claim_text, tier))
+        except STRUCTURED_OUTPUT_ERRORS:
+            # バッチ全体の解析に失敗した場合は全分子を個別に再評価する
+            # （キャンセル・期限切れや通信エラーはそのまま伝える）
+            pass
+    
+    for index, (molecule_string, match_result) in enumerate(items):
+        if index not in verdicts:
+            verdicts[index] = examine_requirements(
+                markush_string, molecule_string, match_result, claim_text, structured=True, tier=tier
+            )
+    return [verdicts[index] for index in range(len(items))]
+
+
+def _examine_group(
+    token: CancellationToken,
+    markush_string: str,
+    molecule_string: str,
+    group_id: str,
+    group_value: str,
+    requirement: str,
+    tier: Optional[str]
+) -> GroupExamination:
+    with use_token(token):
+        return _examine_group_call(markush_string, molecule_string, group_id, group_value, requirement, tier)
+
+
+def group_prompt(
+    markush_string: str,
+    molecule_string: str,
+    group_id: str,
+    group_value: str,
+    requirement: str
+) -> str:
+    """R基1つ分の評価のプロンプトを作成"""
+    return f"""以下のR基1つについて、クエリ分子の置換基がクレーム要件を満たすか検証してください:
+
+**Markushクレーム**: '{markush_string}'
+
+**クエリ分子**:
+{molecule_string}
+
+**R基**: {format_group_id(group_id)}
+**クエリ分子における値**: {format_smiles(group_value)}
+**クレーム要件**: {format_requirement(requirement)}
+
+このR基のみについて判定し、指定されたスキーマで簡潔に回答してください。
+reasonは1文以内、evidenceには根拠となるクレーム番号（例: Claim 1）のみを列挙してください。
+"""
+
+
+def group_inputs(match_result: dict, claim_requirements: dict) -> list[tuple[str, str, str]]:
+    """R基ごとの評価の入力 (R基名, クエリ分子における値, クレーム要件) のリスト"""
+    r_group_mapping = match_result.get("r_group_mapping", {})
+    return [
+        (group_id, r_group_mapping.get(short_group_id(group_id), "N/A"), requirement)
+        for group_id, requirement in claim_requirements.items()
+    ]
+
+
+def _examine_group_call(
+    markush_string: str,
+    molecule_string: str,
+    group_id: str,
+    group_value: str,
+    requirement: str,
+    tier: Optional[str]
+) -> GroupExamination:
+    agent = create_examinator_agent(GROUP_MAX_TOKENS, tier)
+    prompt = group_prompt(markush_string, molecule_string, group_id, group_value, requirement)
+    examination = invoke_agent(agent, prompt, GroupExamination)
+    # 集約時の並び順に使うため、R基名はモデルの出力ではなく入力の値に揃える
+    examination.verdict.group_id = group_id
+    return examination
+
+
+def examine_requirements_per_group(
+    markush_string: str,
+    molecule_string: str,
+    match_result: dict,
+    claim_requirements: dict,
+    tier: Optional[str] = None
+) -> ExaminationVerdict:
+    """R基ごとに独立して並列に検証し、結果を決定的に集約（R基ごとの並列評価モード）
+    
+    各呼び出しにはそのR基の要件テキストのみを渡すため、レイテンシは全R基の合計ではなく
+    最も遅いR基で決まる。いずれかのR基が要件を満たさない時点でNOT PROTECTEDが確定するため、
+    未着手・実行中の評価はキャンセルする。
+    
+    Args:
+        markush_string: Markush構造の拡張SMILES文字列
+        molecule_string: クエリ分子のSMILES文字列
+        match_result: Substituents Matcherからのマッチング結果
+        claim_requirements: R基名 → クレーム要件テキスト（Sketch Extractorの結果）
+        tier: カスケード実行時のモデルティア（"small" / "strong"）
+    
+    Returns:
+        集約された判定（早期終了した場合、評価済みのR基のみを含む）
+    """
+    examinations: list[GroupExamination] = []
+    
+    # R基ごとに子トークンを発行し、早期終了・失敗時に実行中の呼び出しも中断する
+    parent = current_token() or CancellationToken()
+    tokens = []
+    executor = ThreadPoolExecutor(max_workers=GROUP_WORKERS)
+    try:
+        pending = set()
+        for group_id, group_value, requirement in group_inputs(match_result, claim_requirements):
+            token = parent.child()
+            tokens.append(token)
+            pending.add(submit_with_context(
+                executor,
+                _examine_group,
+                token,
+                markush_string,
+                molecule_string,
+                group_id,
+                group_value,
+                requirement,
+                tier
+            ))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            examinations += [future.result() for future in done]
+            if any(not e.verdict.satisfied for e in examinations):
+                break
+    finally:
+        # 早期終了・失敗時は未着手の評価をキャンセルし、実行中の評価も中断して完了を待たない
+        for token in tokens:
+            token.cancel("sibling_group_finished")
+        executor.shutdown(wait=False, cancel_futures=True)
     
-    result = agent(prompt)
-    return str(result)
+    # 完了順ではなくクレーム要件の順に並べて集約する
+    order = list(claim_requirements)
+    examinations.sort(key=lambda e: order.index(e.verdict.group_id))
+    return aggregate_group_examinations(examinations)
@@ -5,21 +5,25 @@ and corrects discrepancies for accuracy
 
 論文の設定: GPT-4oをtemperature=0.2で使用（一貫性と正確性のため）
 """
-import os
+from typing import Optional, Union
+
 from strands import Agent
 from prompts import EXTENDED_SMILES_DEFINITION, FACT_CHECKER_PROMPT_TEMPLATE
 
-MODEL_ID = os.getenv("MODEL_ID", "jp.anthropic.claude-haiku-4-5-20251001-v1:0")
+from .llm import STRUCTURED_MAX_TOKENS, create_model, invoke_agent
+from .verdicts import FactCheckVerdict
+
+STAGE = "fact_checker"
 
 # 論文Appendix Aに基づくプロンプト
 FACT_CHECKER_PROMPT = FACT_CHECKER_PROMPT_TEMPLATE.format(
     extended_smiles_definition=EXTENDED_SMILES_DEFINITION
 )
 
-def create_fact_checker_agent() -> Agent:
+def create_fact_checker_agent(max_tokens: Optional[int] = None, tier: Optional[str] = None) -> Agent:
     """Fact Checkerエージェントを作成"""
     return Agent(
-        model=MODEL_ID,
+        model=create_model(STAGE, tier, max_tokens),
         system_prompt=FACT_CHECKER_PROMPT
     )
 
@@ -27,8 +31,11 @@ def check_facts(
     target_smiles: str,
     block_text: str,
     input_is_protected: bool,
-    input_reasoning: str
-) -> str:
+    input_reasoning: str,
+    structured: bool = False,
+    max_tokens: Optional[int] = None,
+    tier: Optional[str] = None
+) -> Union[str, FactCheckVerdict]:
     """各エージェントの出力を検証
     
     Args:
@@ -36,12 +43,30 @@ def check_facts(
         block_text: 特許PDFブロックテキスト
         input_is_protected: 侵害判定結果
         input_reasoning: 分析推論
+        structured: Trueの場合、FactCheckVerdictを返す構造化出力モード
+        max_tokens: 構造化出力モードの出力トークン上限（省略時はSTRUCTURED_MAX_TOKENS）
+        tier: カスケード実行時のモデルティア（"small" / "strong"）
     
     Returns:
-        検証結果（Markdown形式の文字列）
+        検証結果（Markdown形式の文字列、または構造化モードではFactCheckVerdict）
     """
-    agent = create_fact_checker_agent()
+    prompt = fact_check_prompt(target_smiles, block_text, input_is_protected, input_reasoning, structured)
+    if structured:
+        agent = create_fact_checker_agent(max_tokens or STRUCTURED_MAX_TOKENS, tier)
+        return invoke_agent(agent, prompt, FactCheckVerdict)
     
+    agent = create_fact_checker_agent(tier=tier)
+    return invoke_agent(agent, prompt)
+
+
+def fact_check_prompt(
+    target_smiles: str,
+    block_text: str,
+    input_is_protected: bool,
+    input_reasoning: str,
+    structured: bool = False
+) -> str:
+    """check_factsのプロンプトを作成"""
     prompt = f"""以下の情報に基づいて、侵害分析の推論を検証してください:
 
 # 対象分子:
@@ -55,7 +80,12 @@ def check_facts(
 
 分析: {input_reasoning[:2000]}
 
-上記の分析で使用されたすべての証拠が特許文書に記載されていることを確認してください。
+"""
+    if structured:
+        return prompt + """上記の分析で使用されたすべての証拠が特許文書に記載されているかを確認し、指定されたスキーマで簡潔に回答してください。
+特許文書に存在しない、または矛盾する主張があればdiscrepanciesに列挙してください。
+"""
+    return prompt + """上記の分析で使用されたすべての証拠が特許文書に記載されていることを確認してください。
 出力はMarkdown形式で、見出しや箇条書きを使って読みやすく整形してください。
 
 ## 検証結果
@@ -69,6 +99,3 @@ def check_facts(
 ### 結論
 （検証結果の要約）
 """
-    
-    result = agent(prompt)
-    return str(result)
@@ -0,0 +1,121 @@
+"""ローカルの疑似モデル - 負荷試験用にLLM呼び出しを置き換える
+
+LLM_PROVIDER=fakeのとき、invoke_agentはBedrockを呼び出さずに、設定した遅延
+（FAKE_MODEL_LATENCY_SEC ± FAKE_MODEL_JITTER_SEC）の後で固定の応答を返す。
+判定はsubstituents_matcherのダミー実装と同様に、プロンプト中のクエリ分子のチオフェン環の有無で決める。
+待機中もキャンセルトークンを確認するため、キャンセル・期限の挙動は実モデルと同じになる。
+"""
+import os
+import random
+import re
+import time
+from typing import Optional, Type
+
+from pydantic import BaseModel
+
+from .cancellation import CancellationToken
+from .verdicts import (
+    BatchExaminationVerdict,
+    BatchItemVerdict,
+    ExaminationVerdict,
+    FactCheckVerdict,
+    GroupExamination,
+    GroupVerdict,
+    InfringementReport,
+    VerifiedReport
+)
+
+FAKE_MODEL_LATENCY_SEC = float(os.getenv("FAKE_MODEL_LATENCY_SEC", "1.0"))
+FAKE_MODEL_JITTER_SEC = float(os.getenv("FAKE_MODEL_JITTER_SEC", "0.2"))
+FAKE_MODEL_OUTPUT_TOKENS = int(os.getenv("FAKE_MODEL_OUTPUT_TOKENS", "200"))
+
+# 待機中にキャンセルを確認する間隔（秒）
+_POLL_INTERVAL = 0.05
+
+_BATCH_ITEM = re.compile(r"^### 分子 (\d+)$", re.MULTILINE)
+
+# 各エージェントのプロンプトでクエリ分子を示す見出し（クレーム中のSMILESと区別する）
+_QUERY_MOLECULE = re.compile(r"(?:SMILES: |\*\*クエリ分子\*\*:\s*|# 対象分子:\s*)(\S+)")
+
+
+def _protected(prompt: str) -> bool:
+    match = _QUERY_MOLECULE.search(prompt)
+    molecule = match.group(1) if match else ""
+    return "cccs" in molecule or "ccsc" in molecule
+
+
+def _examination(prompt: str) -> ExaminationVerdict:
+    protected = _protected(prompt)
+    return ExaminationVerdict(
+        groups=[GroupVerdict(group_id="B[5]", value="", satisfied=protected, reason="fake")],
+        overall="PROTECTED" if protected else "NOT_PROTECTED",
+        confidence=0.9,
+        evidence=["Claim 1"]
+    )
+
+
+def _fact_check(prompt: str) -> FactCheckVerdict:
+    return FactCheckVerdict(consistent=True, verified_facts=["Claim 1"], discrepancies=[], confidence=0.9)
+
+
+def _report(prompt: str) -> InfringementReport:
+    verdict = _examination(prompt)
+    return InfringementReport(
+        groups=verdict.groups,
+        overall="INFRINGES" if verdict.is_protected else "NOT_INFRINGES",
+        confidence=0.9,
+        evidence=["Claim 1"],
+        summary="fake"
+    )
+
+
+def _batch(prompt: str) -> BatchExaminationVerdict:
+    # 分子ごとの区切りで分割し、それぞれの部分から判定する
+    parts = _BATCH_ITEM.split(prompt)[1:]
+    return BatchExaminationVerdict(items=[
+        BatchItemVerdict(index=int(index), **_examination(text).model_dump())
+        for index, text in zip(parts[::2], parts[1::2])
+    ])
+
+
+_RESPONSES = {
+    ExaminationVerdict: _examination,
+    GroupExamination: lambda prompt: GroupExamination(
+        verdict=_examination(prompt).groups[0], confidence=0.9, evidence=["Claim 1"]
+    ),
+    BatchExaminationVerdict: _batch,
+    FactCheckVerdict: _fact_check,
+    InfringementReport: _report,
+    VerifiedReport: lambda prompt: VerifiedReport(fact_check=_fact_check(prompt), report=_report(prompt)),
+}
+
+
+class FakeModel:
+    """設定した遅延の後で固定の応答を返す疑似モデル"""
+
+    def __init__(
+        self,
+        latency: float = FAKE_MODEL_LATENCY_SEC,
+        jitter: float = FAKE_MODEL_JITTER_SEC,
+        output_tokens: int = FAKE_MODEL_OUTPUT_TOKENS
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.output_tokens = output_tokens
+
+    def _wait(self, token: Optional[CancellationToken]) -> None:
+        deadline = time.monotonic() + max(self.latency + random.uniform(-self.jitter, self.jitter), 0.0)
+        while (remaining := deadline - time.monotonic()) > 0:
+            if token is not None:
+                token.check()
+            time.sleep(min(_POLL_INTERVAL, remaining))
+
+    def respond(self, prompt: str, output_model: Optional[Type[BaseModel]], token: Optional[CancellationToken]):
+        """遅延の後で応答（output_model指定時はそのインスタンス、それ以外はMarkdownテキスト）"""
+        if token is not None:
+            token.check()
+        self._wait(token)
+        if output_model is not None:
+            return _RESPONSES[output_model](prompt)
+        verdict = "PROTECTED" if _protected(prompt) else "NOT PROTECTED"
+        return f"## 分析結果\n\n### 最終判定\n{verdict}\n\n### 判定理由\nfake\n"
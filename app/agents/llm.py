@@ -0,0 +1,200 @@
+"""LLM呼び出しの共通設定 - ステージ別モデル設定とトークン使用量の記録
+
+モデルIDは以下の優先順で環境変数から解決する:
+
+1. ``{STAGE}_{TIER}_MODEL_ID``（例: EXAMINATOR_SMALL_MODEL_ID）
+2. ``{TIER}_MODEL_ID``（例: SMALL_MODEL_ID）
+3. ``{STAGE}_MODEL_ID``（例: EXAMINATOR_MODEL_ID）
+4. ``MODEL_ID``
+
+TIERはカスケード実行時の"small" / "strong"。通常実行（tier=None）では3→4のみ参照する。
+
+LLM_PROVIDER=fakeのときは、Bedrockの代わりにローカルの疑似モデル（fake_model.py）で応答する（負荷試験用）。
+"""
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+
+from .cache import cache_key, get_cache
+from .cancellation import AssessmentCancelled, CancellationToken, current_token
+from .fake_model import FakeModel
+
+if TYPE_CHECKING:
+    # strandsはモデル・エージェントの作成時に読み込む（使用量の集計やキャッシュはstrandsなしで使える）
+    from strands import Agent
+
+DEFAULT_MODEL_ID = "jp.anthropic.claude-haiku-4-5-20251001-v1:0"
+
+# キャンセル・期限の確認間隔（秒）
+CANCEL_POLL_INTERVAL = 0.1
+
+# 構造化出力モードの出力トークン上限
+STRUCTURED_MAX_TOKENS = int(os.getenv("STRUCTURED_MAX_TOKENS", "1024"))
+
+# bedrock（既定）/ fake
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "bedrock")
+
+T = TypeVar("T", bound=BaseModel)
+
+_fake_model: Optional[FakeModel] = FakeModel() if LLM_PROVIDER == "fake" else None
+
+_usage: ContextVar[Optional[dict]] = ContextVar("llm_usage", default=None)
+
+
+def get_model_id(stage: str, tier: Optional[str] = None) -> str:
+    """ステージとティアに対応するモデルIDを取得"""
+    stage_key = stage.upper()
+    candidates = []
+    if tier:
+        tier_key = tier.upper()
+        candidates += [f"{stage_key}_{tier_key}_MODEL_ID", f"{tier_key}_MODEL_ID"]
+    candidates += [f"{stage_key}_MODEL_ID", "MODEL_ID"]
+    for name in candidates:
+        value = os.getenv(name)
+        if value:
+            return value
+    return DEFAULT_MODEL_ID
+
+
+def estimate_tokens(text: str) -> int:
+    """プロンプトのトークン数の概算（実測ではない）
+
+    ASCII文字（英語・SMILES・JSON）は3文字で1トークン、日本語などの非ASCII文字は
+    1文字で少なくとも1トークンとして数える。
+    """
+    non_ascii = sum(1 for char in text if not char.isascii())
+    return (len(text) - non_ascii) // 3 + non_ascii + 1
+
+
+def create_model(stage: str, tier: Optional[str] = None, max_tokens: Optional[int] = None):
+    """Agentに渡すモデルを作成（出力トークン上限がない場合はモデルID文字列）"""
+    model_id = get_model_id(stage, tier)
+    if max_tokens is None:
+        return model_id
+    from strands.models import BedrockModel
+    return BedrockModel(model_id=model_id, max_tokens=max_tokens)
+
+
+@contextmanager
+def track_usage():
+    """ブロック内のLLM呼び出しのトークン使用量と経過時間を集計
+
+    Yields:
+        {"input_tokens", "output_tokens", "calls", "model_ids", "latency"} の辞書
+    """
+    usage = {"input_tokens": 0, "output_tokens": 0, "calls": 0, "model_ids": [], "latency": 0.0}
+    token = _usage.set(usage)
+    start = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        usage["latency"] = time.perf_counter() - start
+        _usage.reset(token)
+
+
+def use_fake_model(model: Optional[FakeModel]) -> None:
+    """以降のLLM呼び出しを疑似モデルで置き換える（Noneで実モデルに戻す）"""
+    global _fake_model
+    _fake_model = model
+
+
+def _add_usage(input_tokens: int, output_tokens: int, model_id: str) -> None:
+    usage = _usage.get()
+    if usage is None:
+        return
+    usage["input_tokens"] += input_tokens
+    usage["output_tokens"] += output_tokens
+    usage["calls"] += 1
+    usage["model_ids"].append(model_id)
+
+
+def _record_usage(agent: "Agent") -> None:
+    accumulated = agent.event_loop_metrics.accumulated_usage
+    _add_usage(
+        accumulated.get("inputTokens", 0),
+        accumulated.get("outputTokens", 0),
+        agent.model.get_config().get("model_id", "")
+    )
+
+
+async def _await_cancellable(coro, token: CancellationToken):
+    """キャンセル・期限切れを監視しながらコルーチンを待ち、該当すれば中断"""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            remaining = token.remaining()
+            timeout = CANCEL_POLL_INTERVAL if remaining is None else max(min(CANCEL_POLL_INTERVAL, remaining), 0)
+            done, _ = await asyncio.wait({task}, timeout=timeout)
+            if done:
+                return task.result()
+            token.check()
+    except AssessmentCancelled:
+        task.cancel()
+        raise
+
+
+def _agent_cache_key(agent: "Agent", prompt: str, output_model: Optional[Type[T]]) -> str:
+    """モデル設定・システムプロンプト・プロンプト・出力形式から決まる応答のキャッシュキー"""
+    return cache_key(
+        "agent",
+        agent.model.get_config(),
+        agent.system_prompt,
+        prompt,
+        output_model.__name__ if output_model is not None else None
+    )
+
+
+def invoke_agent(agent: "Agent", prompt: str, output_model: Optional[Type[T]] = None):
+    """エージェントを呼び出し、トークン使用量を記録
+
+    共有キャッシュ（CACHE_BACKEND）が有効な場合は同じ入力に対する応答を再利用する
+    （ヒット時はLLMを呼び出さないため使用量は記録しない）。
+    キャンセルトークンが設定されている場合は、呼び出し前に確認し、
+    呼び出し中にキャンセル・期限切れになった時点でリクエストを中断する。
+
+    Args:
+        agent: 呼び出すエージェント
+        prompt: プロンプト
+        output_model: 指定した場合は構造化出力（pydanticモデル）を返す
+
+    Returns:
+        output_model指定時はそのインスタンス、それ以外は応答テキスト
+
+    Raises:
+        AssessmentCancelled: キャンセルされた、または期限を超過した場合
+    """
+    if _fake_model is not None:
+        # 疑似モデルの応答は共有キャッシュに入れない
+        return _invoke_fake(agent, prompt, output_model)
+    return get_cache().get_or_compute(
+        _agent_cache_key(agent, prompt, output_model),
+        lambda: _invoke(agent, prompt, output_model)
+    )
+
+
+def _invoke_fake(agent: "Agent", prompt: str, output_model: Optional[Type[T]] = None):
+    try:
+        return _fake_model.respond(prompt, output_model, current_token())
+    finally:
+        _add_usage(estimate_tokens(agent.system_prompt + prompt), _fake_model.output_tokens, "fake")
+
+
+def _invoke(agent: "Agent", prompt: str, output_model: Optional[Type[T]] = None):
+    token = current_token()
+    try:
+        if token is None:
+            if output_model is not None:
+                return agent.structured_output(output_model, prompt)
+            return str(agent(prompt))
+        
+        token.check()
+        if output_model is not None:
+            return asyncio.run(_await_cancellable(agent.structured_output_async(output_model, prompt), token))
+        return str(asyncio.run(_await_cancellable(agent.invoke_async(prompt), token)))
+    finally:
+        _record_usage(agent)
@@ -0,0 +1,114 @@
+"""エージェント間ペイロードのプロンプト向けシリアライズ
+
+Sketch Extractor / Substituents Matcher / 判定の結果をプロンプトに埋め込む際に、
+Pythonのreprではなく、トークン数の少ない安定した表現に変換する:
+
+- JSONはキーを整列し、区切りの空白を省く
+- R基名は短い形式に揃える（B[5] → B5）
+- 同じプロンプトに含まれる値は重複して渡さない（判定中のR基の値とR基マッピング）
+- クレーム要件の併記された和訳（全角括弧内）を除く
+- SMILESは前後の空白を除き、水素の表記を[H]に揃える
+
+環境変数PROMPT_PAYLOAD_FORMAT=reprで従来のrepr形式に戻せる
+（benchmark_prompt_tokens.pyでの比較にも使う）。
+"""
+import json
+import os
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from pydantic import BaseModel
+
+PROMPT_PAYLOAD_FORMAT = os.getenv("PROMPT_PAYLOAD_FORMAT", "compact")
+
+_format: ContextVar[str] = ContextVar("prompt_payload_format", default=PROMPT_PAYLOAD_FORMAT)
+
+# 英語の要件の後ろに併記された和訳（例: "H or CH3（HまたはCH3）"）
+_TRANSLATION = re.compile(r"(?<=[\x21-\x7e])\s*（[^（）]*）\s*$")
+
+_HYDROGEN_FORMS = {"H", "[H]", "[H][H]", "[HH]"}
+
+
+@contextmanager
+def use_payload_format(name: str):
+    """ブロック内のシリアライズ形式（"compact" / "repr"）を切り替え"""
+    reset = _format.set(name)
+    try:
+        yield
+    finally:
+        _format.reset(reset)
+
+
+def current_payload_format() -> str:
+    """現在のシリアライズ形式（"compact" / "repr"）"""
+    return _format.get()
+
+
+def _compact() -> bool:
+    return _format.get() != "repr"
+
+
+def short_group_id(group_id: str) -> str:
+    """R基名を短い形式に変換（B[5] → B5、R基マッピングのキーと同じ形式）"""
+    return group_id.replace("[", "").replace("]", "")
+
+
+def normalize_smiles(smiles: str) -> str:
+    """R基の値のSMILESを一貫した表記に揃える"""
+    smiles = smiles.strip()
+    return "[H]" if smiles in _HYDROGEN_FORMS else smiles
+
+
+def strip_translation(text: str) -> str:
+    """クレーム要件の英語表記に併記された和訳を除く"""
+    return _TRANSLATION.sub("", text)
+
+
+def format_json(value: Any) -> str:
+    """キーを整列し、空白を省いたJSON"""
+    return json.dumps(value, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def format_group_id(group_id: str) -> str:
+    return short_group_id(group_id) if _compact() else group_id
+
+
+def format_smiles(smiles: str) -> str:
+    return normalize_smiles(smiles) if _compact() else smiles
+
+
+def format_requirement(text: str) -> str:
+    return strip_translation(text) if _compact() else text
+
+
+def format_mapping(r_group_mapping: dict) -> str:
+    """R基マッピング（R基名 → 値のSMILES）"""
+    if not _compact():
+        return str(r_group_mapping)
+    return format_json({short_group_id(k): normalize_smiles(v) for k, v in r_group_mapping.items()})
+
+
+def format_requirements(claim_requirements: dict) -> str:
+    """クレーム要件（R基名 → 要件テキスト）"""
+    if not _compact():
+        return str(claim_requirements)
+    return format_json({short_group_id(k): strip_translation(v) for k, v in claim_requirements.items()})
+
+
+def format_verdict(verdict: BaseModel, omit_group_values: bool = False) -> str:
+    """構造化判定（ExaminationVerdict / FactCheckVerdict）
+
+    Args:
+        verdict: 判定
+        omit_group_values: R基マッピングを同じプロンプトに含める場合にTrue（R基ごとの値の重複を除く）
+    """
+    if not _compact():
+        return verdict.model_dump_json()
+    data = verdict.model_dump()
+    for group in data.get("groups", []):
+        group["group_id"] = short_group_id(group["group_id"])
+        if omit_group_values:
+            del group["value"]
+    return format_json(data)
@@ -5,21 +5,26 @@ a comprehensive infringement report
 
 論文の設定: GPT-4oをtemperature=0.2で使用（一貫性と正確性のため）
 """
-import os
+from typing import Optional, Union
+
 from strands import Agent
 from prompts import EXTENDED_SMILES_DEFINITION, PLANNER_PROMPT_TEMPLATE
 
-MODEL_ID = os.getenv("MODEL_ID", "jp.anthropic.claude-haiku-4-5-20251001-v1:0")
+from .llm import STRUCTURED_MAX_TOKENS, create_model, invoke_agent
+from .payloads import format_mapping, format_requirements, format_verdict
+from .verdicts import ExaminationVerdict, FactCheckVerdict, InfringementReport, VerifiedReport
+
+STAGE = "planner"
 
 # 論文Appendix Aに基づくプロンプト
 PLANNER_PROMPT = PLANNER_PROMPT_TEMPLATE.format(
     extended_smiles_definition=EXTENDED_SMILES_DEFINITION
 )
 
-def create_planner_agent() -> Agent:
+def create_planner_agent(max_tokens: Optional[int] = None, tier: Optional[str] = None) -> Agent:
     """Plannerエージェントを作成"""
     return Agent(
-        model=MODEL_ID,
+        model=create_model(STAGE, tier, max_tokens),
         system_prompt=PLANNER_PROMPT
     )
 
@@ -28,9 +33,12 @@ def plan_and_coordinate(
     patent_info: str,
     sketch_result: dict,
     matcher_result: dict,
-    examinator_result: str,
-    fact_check_result: str
-) -> str:
+    examinator_result: Union[str, ExaminationVerdict],
+    fact_check_result: Union[str, FactCheckVerdict],
+    structured: bool = False,
+    max_tokens: Optional[int] = None,
+    tier: Optional[str] = None
+) -> Union[str, InfringementReport]:
     """全エージェントの結果を統合して最終レポートを作成
     
     Args:
@@ -38,35 +46,89 @@ def plan_and_coordinate(
         patent_info: 特許情報テキスト
         sketch_result: Sketch Extractorの結果
         matcher_result: Substituents Matcherの結果
-        examinator_result: Requirements Examinatorの結果
-        fact_check_result: Fact Checkerの結果
+        examinator_result: Requirements Examinatorの結果（Markdown文字列またはExaminationVerdict）
+        fact_check_result: Fact Checkerの結果（Markdown文字列またはFactCheckVerdict）
+        structured: Trueの場合、InfringementReportを返す構造化出力モード
+        max_tokens: 構造化出力モードの出力トークン上限（省略時はSTRUCTURED_MAX_TOKENS）
+        tier: カスケード実行時のモデルティア（"small" / "strong"）
     
     Returns:
-        侵害レポート（Markdown形式の文字列）
+        侵害レポート（Markdown形式の文字列、または構造化モードではInfringementReport）
     """
-    agent = create_planner_agent()
+    prompt = report_prompt(
+        query_molecule, patent_info, sketch_result, matcher_result, examinator_result, fact_check_result, structured
+    )
+    if structured:
+        agent = create_planner_agent(max_tokens or STRUCTURED_MAX_TOKENS, tier)
+        return invoke_agent(agent, prompt, InfringementReport)
     
-    prompt = f"""以下の情報に基づいて、特許侵害評価の最終レポートを作成してください:
+    agent = create_planner_agent(tier=tier)
+    return invoke_agent(agent, prompt)
 
-## クエリ分子
-SMILES: {query_molecule}
-
-## 特許情報
-{patent_info[:2000]}
 
-## Sketch Extractor結果
+def _agent_results(sketch_result: dict, matcher_result: dict) -> str:
+    """Sketch Extractor・Substituents Matcherの結果のプロンプト表現"""
+    return f"""## Sketch Extractor結果
 コアMarkush構造: {sketch_result.get('core_markush_smiles', 'N/A')}
-クレーム要件: {sketch_result.get('claim_requirements', {})}
+クレーム要件: {format_requirements(sketch_result.get('claim_requirements', {}))}
 
 ## Substituents Matcher結果
-R基マッピング: {matcher_result.get('r_group_mapping', {})}
+R基マッピング: {format_mapping(matcher_result.get('r_group_mapping', {}))}
 骨格マッチ: {matcher_result.get('skeleton_match', False)}
+"""
+
 
+def report_prompt(
+    query_molecule: str,
+    patent_info: str,
+    sketch_result: dict,
+    matcher_result: dict,
+    examinator_result: Union[str, ExaminationVerdict],
+    fact_check_result: Union[str, FactCheckVerdict],
+    structured: bool = False
+) -> str:
+    """plan_and_coordinateのプロンプトを作成"""
+    if isinstance(examinator_result, ExaminationVerdict):
+        # 構造化判定はそのままJSONで渡す（切り詰め不要、R基の値はR基マッピングと重複するため除く）
+        examinator_text = format_verdict(examinator_result, omit_group_values=True)
+    else:
+        examinator_text = examinator_result[:2000]
+    if isinstance(fact_check_result, FactCheckVerdict):
+        fact_check_text = format_verdict(fact_check_result)
+    else:
+        fact_check_text = fact_check_result[:2000]
+    
+    if structured:
+        return f"""以下の情報に基づいて、特許侵害評価の最終判定を作成してください:
+
+## クエリ分子
+SMILES: {query_molecule}
+
+{_agent_results(sketch_result, matcher_result)}
 ## Requirements Examinator結果
-{examinator_result[:2000]}
+{examinator_text}
 
 ## Fact Checker結果
-{fact_check_result[:2000]}
+{fact_check_text}
+
+上記の全ての分析結果を統合し、指定されたスキーマで簡潔に回答してください。
+reasonは1文以内、summaryは3文以内、evidenceには根拠となるクレーム番号（例: Claim 1）のみを列挙してください。
+"""
+    
+    return f"""以下の情報に基づいて、特許侵害評価の最終レポートを作成してください:
+
+## クエリ分子
+SMILES: {query_molecule}
+
+## 特許情報
+{patent_info[:2000]}
+
+{_agent_results(sketch_result, matcher_result)}
+## Requirements Examinator結果
+{examinator_text}
+
+## Fact Checker結果
+{fact_check_text}
 
 上記の全ての分析結果を統合し、包括的な侵害レポートをMarkdown形式で作成してください。
 
@@ -87,6 +149,64 @@ R基マッピング: {matcher_result.get('r_group_mapping', {})}
 ## 5. 判定理由
 （詳細な理由の説明）
 """
+
+
+def verify_and_report(
+    query_molecule: str,
+    patent_info: str,
+    sketch_result: dict,
+    matcher_result: dict,
+    examinator_result: ExaminationVerdict,
+    max_tokens: Optional[int] = None,
+    tier: Optional[str] = None
+) -> VerifiedReport:
+    """事実検証と最終レポート作成を1回の呼び出しで実行（融合モード）
+    
+    Fact Checker → Plannerの2回の逐次呼び出しを1回にまとめ、
+    特許文書と判定の読み込みも1回で済ませる。
     
-    result = agent(prompt)
-    return str(result)
+    Args:
+        query_molecule: クエリ分子のSMILES文字列
+        patent_info: 特許情報テキスト
+        sketch_result: Sketch Extractorの結果
+        matcher_result: Substituents Matcherの結果
+        examinator_result: Requirements Examinatorの構造化判定
+        max_tokens: 出力トークン上限（省略時はSTRUCTURED_MAX_TOKENSの2倍）
+        tier: カスケード実行時のモデルティア（"small" / "strong"）
+    
+    Returns:
+        事実検証結果と侵害レポート
+    """
+    agent = create_planner_agent(max_tokens or STRUCTURED_MAX_TOKENS * 2, tier)
+    prompt = verified_report_prompt(query_molecule, patent_info, sketch_result, matcher_result, examinator_result)
+    return invoke_agent(agent, prompt, VerifiedReport)
+
+
+def verified_report_prompt(
+    query_molecule: str,
+    patent_info: str,
+    sketch_result: dict,
+    matcher_result: dict,
+    examinator_result: ExaminationVerdict
+) -> str:
+    """verify_and_reportのプロンプトを作成"""
+    return f"""以下の情報に基づいて、侵害分析の推論を検証したうえで、特許侵害評価の最終判定を作成してください:
+
+## クエリ分子
+SMILES: {query_molecule}
+
+## 特許PDFブロック
+{patent_info[:3000]}
+
+{_agent_results(sketch_result, matcher_result)}
+## Requirements Examinator結果
+{format_verdict(examinator_result, omit_group_values=True)}
+
+手順:
+1. fact_check: Requirements Examinatorの分析で使用されたすべての証拠が特許PDFブロックに記載されているかを確認してください。
+   特許文書に存在しない、または矛盾する主張があればdiscrepanciesに列挙してください。
+2. report: 検証済みの証拠のみに基づいて最終判定を作成してください。
+
+指定されたスキーマで簡潔に回答してください。
+reasonは1文以内、summaryは3文以内、evidenceには根拠となるクレーム番号（例: Claim 1）のみを列挙してください。
+"""
@@ -8,6 +8,7 @@ in Markush expressions relative to the query molecule
 2. MarkushMatcher（ニューラルネットワーク、T5ベース）→ nn_result
 3. LLMエージェント（GPT-4o with vision）→ 両結果を検証・統合
 """
+from .cancellation import check_cancelled
 
 
 def rdkit_substructure_match(query_molecule: str, markush_structure: dict) -> dict:
@@ -90,14 +91,19 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
     1. RDKitでルールベースマッチング
     2. MarkushMatcherでNNベースマッチング
     3. 両結果を統合（実際はLLMエージェントが検証・統合）
+    
+    各ステップの前に現在のキャンセルトークンを確認する。
     """
     # Step 1: RDKitによるルールベースマッチング
+    check_cancelled()
     rdkit_result = rdkit_substructure_match(query_molecule, markush_structure)
     
     # Step 2: MarkushMatcherによるNNベースマッチング
+    check_cancelled()
     nn_result = markush_matcher_nn(query_molecule, markush_structure)
     
     # Step 3: 結果の統合
+    check_cancelled()
     verified_mapping = {}
     for key in rdkit_result["r_group_mapping"]:
         rdkit_value = rdkit_result["r_group_mapping"].get(key, "")
@@ -109,16 +115,19 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
         b5_nn = "C1=CC=CS1"
         b5_desc = "Thiophene ring（チオフェン環）- 硫黄含有5員環"
         b5_status = "両手法で一致（thiophenyl）"
+        b5_agree = True
     elif "ccnnc" in query_molecule:
         b5_verified = "c1ccnnc1"
         b5_nn = "CC1C=NN=CC=1"
         b5_desc = "Pyridazine ring（ピリダジン環）- 窒素含有6員環"
         b5_status = "両手法で一致（pyridazinyl）"
+        b5_agree = True
     else:
         b5_verified = "unknown"
         b5_nn = "unknown"
         b5_desc = "Unknown substituent"
         b5_status = "不明"
+        b5_agree = False
     
     return {
         "query_molecule": query_molecule,
@@ -132,7 +141,8 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
         # 検証済みの統合結果
         "r_group_mapping": verified_mapping,
         
-        # 詳細な置換基分析
+        # 詳細な置換基分析（match_statusは表示用の説明。RDKitとNNの値が同じ置換基を表すかは
+        # branches_agreeで示し、カスケードの昇格判定に使う）
         "substituent_analysis": [
             {
                 "group_id": "B[5]",
@@ -141,7 +151,8 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
                 "nn_value": b5_nn,
                 "verified_value": b5_verified,
                 "description": b5_desc,
-                "match_status": b5_status
+                "match_status": b5_status,
+                "branches_agree": b5_agree
             },
             {
                 "group_id": "B[3]",
@@ -150,7 +161,8 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
                 "nn_value": "[H]",
                 "verified_value": "[H][H]",
                 "description": "Hydrogen（水素）",
-                "match_status": "両手法で一致"
+                "match_status": "両手法で一致",
+                "branches_agree": True
             },
             {
                 "group_id": "D[1]",
@@ -159,7 +171,8 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
                 "nn_value": "C1N=CC=CC=1",
                 "verified_value": "c1ccccn1",
                 "description": "Pyridine ring（ピリジン環）",
-                "match_status": "両手法で一致（表記の違いのみ）"
+                "match_status": "両手法で一致（表記の違いのみ）",
+                "branches_agree": True
             },
             {
                 "group_id": "R[21]",
@@ -168,7 +181,8 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
                 "nn_value": "[H]",
                 "verified_value": "[H][H]",
                 "description": "Hydrogen（水素）",
-                "match_status": "両手法で一致"
+                "match_status": "両手法で一致",
+                "branches_agree": True
             },
             {
                 "group_id": "R[22]",
@@ -177,7 +191,8 @@ def match_substituents(query_molecule: str, markush_structure: dict) -> dict:
                 "nn_value": "[H]",
                 "verified_value": "[H][H]",
                 "description": "Hydrogen（水素）",
-                "match_status": "両手法で一致"
+                "match_status": "両手法で一致",
+                "branches_agree": True
             }
         ],
         
@@ -0,0 +1,184 @@
+"""構造化判定スキーマ - Requirements Examinator / Plannerの構造化出力モード用
+
+自由形式のMarkdownの代わりに、スキーマ検証済みの小さなオブジェクトを返す。
+Markdownへの変換は人間が結果を閲覧するときにのみ行う。
+"""
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field
+
+
+class GroupVerdict(BaseModel):
+    """R基ごとの判定"""
+    group_id: str = Field(description="R基名（例: B[5]）")
+    value: str = Field(description="クエリ分子におけるR基の値（SMILES）")
+    satisfied: bool = Field(description="クレーム要件を満たす場合はtrue")
+    reason: str = Field(description="判定理由（1文以内）")
+
+
+class ExaminationVerdict(BaseModel):
+    """Requirements Examinatorの構造化判定"""
+    groups: list[GroupVerdict]
+    overall: Literal["PROTECTED", "NOT_PROTECTED"]
+    confidence: float = Field(ge=0.0, le=1.0, description="判定の確信度（0〜1）")
+    evidence: list[str] = Field(default_factory=list, description="根拠となるクレーム番号等（例: Claim 1）")
+
+    @property
+    def is_protected(self) -> bool:
+        return self.overall == "PROTECTED"
+
+
+class GroupExamination(BaseModel):
+    """R基1つ分の独立評価の結果（R基ごとの並列評価モード用）"""
+    verdict: GroupVerdict
+    confidence: float = Field(ge=0.0, le=1.0, description="判定の確信度（0〜1）")
+    evidence: list[str] = Field(default_factory=list, description="根拠となるクレーム番号等（例: Claim 1）")
+
+
+def aggregate_group_examinations(examinations: list[GroupExamination]) -> ExaminationVerdict:
+    """R基ごとの評価結果を決定的に集約
+
+    全てのR基が要件を満たす場合のみPROTECTED。確信度は最小値、根拠は重複を除いて整列する。
+    """
+    return ExaminationVerdict(
+        groups=[examination.verdict for examination in examinations],
+        overall="PROTECTED" if examinations and all(e.verdict.satisfied for e in examinations) else "NOT_PROTECTED",
+        confidence=min((e.confidence for e in examinations), default=0.0),
+        evidence=sorted({ref for e in examinations for ref in e.evidence})
+    )
+
+
+class BatchItemVerdict(ExaminationVerdict):
+    """バッチ評価における1分子分の判定"""
+    index: int = Field(description="入力リストにおける分子の番号（0から開始）")
+
+
+class BatchExaminationVerdict(BaseModel):
+    """Requirements Examinatorのバッチ評価結果"""
+    items: list[BatchItemVerdict]
+
+
+class InfringementReport(BaseModel):
+    """Plannerの構造化レポート"""
+    groups: list[GroupVerdict]
+    overall: Literal["INFRINGES", "NOT_INFRINGES"]
+    confidence: float = Field(ge=0.0, le=1.0, description="判定の確信度（0〜1）")
+    evidence: list[str] = Field(default_factory=list, description="根拠となるクレーム番号等（例: Claim 1）")
+    summary: str = Field(description="結論の要約（3文以内）")
+
+    @property
+    def infringes(self) -> bool:
+        return self.overall == "INFRINGES"
+
+
+class FactCheckVerdict(BaseModel):
+    """Fact Checkerの構造化検証結果"""
+    consistent: bool = Field(description="推論の全ての証拠が特許文書に存在する場合はtrue")
+    verified_facts: list[str] = Field(default_factory=list, description="特許文書で確認された事実（各1文）")
+    discrepancies: list[str] = Field(default_factory=list, description="特許文書に存在しない、または矛盾する主張")
+    confidence: float = Field(ge=0.0, le=1.0, description="検証の確信度（0〜1）")
+
+
+class VerifiedReport(BaseModel):
+    """融合モード（事実検証＋最終レポートを1回の呼び出しで作成）の出力"""
+    fact_check: FactCheckVerdict
+    report: InfringementReport
+
+
+# 永続化（チェックポイント・キャッシュ）対象の構造化出力: 型名 → pydanticモデル
+_OUTPUT_MODELS = {
+    model.__name__: model
+    for model in (
+        ExaminationVerdict,
+        FactCheckVerdict,
+        InfringementReport,
+        VerifiedReport,
+        GroupExamination,
+        BatchExaminationVerdict
+    )
+}
+
+
+def encode_output(value: Any) -> dict:
+    """ステージ・エージェントの出力をJSON化可能な辞書に変換"""
+    if type(value).__name__ in _OUTPUT_MODELS:
+        return {"type": type(value).__name__, "value": value.model_dump()}
+    return {"type": "json", "value": value}
+
+
+def decode_output(payload: dict) -> Any:
+    """encode_outputの逆変換"""
+    model = _OUTPUT_MODELS.get(payload["type"])
+    return model.model_validate(payload["value"]) if model else payload["value"]
+
+
+def _render_groups(groups: list[GroupVerdict]) -> list[str]:
+    lines = []
+    for group in groups:
+        mark = "✅ 適合" if group.satisfied else "❌ 不適合"
+        lines.append(f"- **{group.group_id}** `{group.value}`: {mark} - {group.reason}")
+    return lines
+
+
+def _render_evidence(evidence: list[str]) -> list[str]:
+    return [f"- {ref}" for ref in evidence] or ["- （なし）"]
+
+
+def render_examination_markdown(verdict: ExaminationVerdict) -> str:
+    """ExaminationVerdictを表示用のMarkdownに変換"""
+    lines = ["## 分析結果", "", "### R基適合性チェック"]
+    lines += _render_groups(verdict.groups)
+    lines += [
+        "",
+        "### 最終判定",
+        f"**{verdict.overall.replace('_', ' ')}** (確信度: {verdict.confidence:.2f})",
+        "",
+        "### 根拠",
+    ]
+    lines += _render_evidence(verdict.evidence)
+    return "\n".join(lines)
+
+
+def render_fact_check_markdown(verdict: FactCheckVerdict) -> str:
+    """FactCheckVerdictを表示用のMarkdownに変換"""
+    lines = ["## 検証結果", "", "### 検証済み事実"]
+    lines += _render_evidence(verdict.verified_facts)
+    lines += ["", "### 不整合"]
+    lines += _render_evidence(verdict.discrepancies)
+    conclusion = "✅ 証拠は特許文書に裏付けられている" if verdict.consistent else "❌ 裏付けのない証拠がある"
+    lines += ["", "### 結論", f"{conclusion} (確信度: {verdict.confidence:.2f})"]
+    return "\n".join(lines)
+
+
+def render_report_markdown(report: InfringementReport) -> str:
+    """InfringementReportを表示用のMarkdownに変換"""
+    lines = ["# 特許侵害評価レポート", "", "## R基適合性分析"]
+    lines += _render_groups(report.groups)
+    lines += [
+        "",
+        "## 最終判定",
+        f"**{report.overall}** (確信度: {report.confidence:.2f})",
+        "",
+        "## 判定理由",
+        report.summary,
+        "",
+        "## 根拠",
+    ]
+    lines += _render_evidence(report.evidence)
+    return "\n".join(lines)
+
+
+def examination_is_protected(examinator_result) -> bool:
+    """Requirements Examinatorの結果からPROTECTED判定を取得
+
+    構造化判定の場合はoverallを直接参照し、Markdown文字列の場合は
+    従来どおり否定表現の有無で判定する。
+    """
+    if isinstance(examinator_result, ExaminationVerdict):
+        return examinator_result.is_protected
+    text = str(examinator_result)
+    return (
+        "not_protected" not in text.lower()
+        and "not protected" not in text.lower()
+        and "保護されていない" not in text
+    )
@@ -0,0 +1,105 @@
+"""融合モードのベンチマーク - 従来の5呼び出し経路とレイテンシ・判定一致率を比較
+
+使い方:
+    python benchmark_fused.py [--cases cases.jsonl] [--repeat 3] [--use-cache]
+
+cases.jsonlは1行1ケースで {"id": ..., "query_molecule": ..., "patent_info": ...}
+（patent_infoの代わりにpatent_fileでファイルを指定可）。省略時はsample_dataの2ケースを使う。
+
+共有キャッシュ（CACHE_BACKEND）が有効だと2回目以降がキャッシュヒットになりレイテンシを比較できないため、
+--use-cacheを指定しない限りキャッシュを無効にして実行する。
+キャンセル・タイムアウト・エラーで完了しなかった実行は行に理由を記録し、集計から除外する。
+"""
+import argparse
+import json
+import statistics
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from agents.cache import NullCache, use_cache
+from pipeline import PipelineOptions, run_assessment
+from sample_data import SAMPLE_PATENT_CLAIM, SAMPLE_PROTECTED_MOLECULE, SAMPLE_QUERY_MOLECULE
+
+MODES = {
+    "five_call": PipelineOptions(structured=True),
+    "fused": PipelineOptions(fused=True),
+}
+
+
+def load_cases(path: Optional[str] = None) -> list[dict]:
+    if path is None:
+        return [
+            {"id": "sample_not_protected", "query_molecule": SAMPLE_QUERY_MOLECULE, "patent_info": SAMPLE_PATENT_CLAIM},
+            {"id": "sample_protected", "query_molecule": SAMPLE_PROTECTED_MOLECULE, "patent_info": SAMPLE_PATENT_CLAIM},
+        ]
+    cases = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        case = json.loads(line)
+        if "patent_file" in case:
+            case["patent_info"] = Path(case["patent_file"]).read_text(encoding="utf-8")
+        cases.append(case)
+    return cases
+
+
+def _run_mode(case: dict, options: PipelineOptions) -> dict:
+    """1モード分を実行し、所要時間と最終判定（完了しなかった場合は理由）を返す"""
+    try:
+        run = run_assessment(case["query_molecule"], case["patent_info"], options)
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+    if run.aborted:
+        return {"error": f"{run.aborted['stage']}で中断: {run.aborted['reason']}"}
+    if not run.completed:
+        return {"error": "未完了"}
+    return {"sec": sum(run.timings.values()), "verdict": run.outputs["planner"].overall}
+
+
+def benchmark(cases: list[dict], repeat: int = 1, use_shared_cache: bool = False) -> dict:
+    """各ケースを両モードで実行し、レイテンシと最終判定の一致を集計"""
+    if not use_shared_cache:
+        use_cache(NullCache())
+    rows = []
+    for case in cases:
+        for _ in range(repeat):
+            row = {"id": case["id"]}
+            for mode, options in MODES.items():
+                for key, value in _run_mode(case, options).items():
+                    row[f"{mode}_{key}"] = value
+            skipped = any(f"{mode}_error" in row for mode in MODES)
+            if not skipped:
+                row["agree"] = row["five_call_verdict"] == row["fused_verdict"]
+            rows.append(row)
+            print(json.dumps(row, ensure_ascii=False))
+
+    measured = [row for row in rows if "agree" in row]
+    summary = {"runs": len(rows), "skipped": len(rows) - len(measured)}
+    if not measured:
+        return summary
+    five_call = statistics.median(row["five_call_sec"] for row in measured)
+    fused = statistics.median(row["fused_sec"] for row in measured)
+    return {
+        **summary,
+        "five_call_median_sec": five_call,
+        "fused_median_sec": fused,
+        "speedup": five_call / fused,
+        "verdict_agreement": sum(row["agree"] for row in measured) / len(measured),
+    }
+
+
+def main() -> None:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="融合モードと5呼び出し経路のベンチマーク")
+    parser.add_argument("--cases", help="ベンチマークケースのJSONLファイル")
+    parser.add_argument("--repeat", type=int, default=1, help="ケースごとの繰り返し回数")
+    parser.add_argument("--use-cache", action="store_true", help="共有キャッシュを有効のまま計測する")
+    args = parser.parse_args()
+    summary = benchmark(load_cases(args.cases), args.repeat, args.use_cache)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""プロンプトのトークン数の計測 - エージェント間ペイロードのシリアライズ形式の比較
+
+従来のrepr形式（before）とコンパクト形式（after）で各エージェントのプロンプトを作成し、
+プロンプトごとの推定トークン数（システムプロンプトを含む入力全体）を比較する。LLMは呼び出さない。
+トークン数はestimate_tokensによる概算でトークナイザの実測値ではないため、出力の項目には_estを付ける。
+
+使い方:
+    python benchmark_prompt_tokens.py [--cases cases.jsonl]
+
+ケースの形式はbenchmark_fused.pyと同じ。
+"""
+import argparse
+import json
+
+from agents import ExaminationVerdict, FactCheckVerdict, GroupVerdict, extract_markush_structure, match_substituents
+from agents.examinator import EXAMINATOR_PROMPT, batch_prompt, examination_prompt, group_prompt
+from agents.fact_checker import FACT_CHECKER_PROMPT, fact_check_prompt
+from agents.llm import estimate_tokens
+from agents.payloads import format_verdict, short_group_id, use_payload_format
+from agents.planner import PLANNER_PROMPT, report_prompt, verified_report_prompt
+from benchmark_fused import load_cases
+
+FORMATS = {"before": "repr", "after": "compact"}
+
+# プロンプト名の接頭辞 → そのプロンプトを送るエージェントのシステムプロンプト（融合モードはPlanner）
+SYSTEM_PROMPTS = {
+    "examinator": EXAMINATOR_PROMPT,
+    "fact_checker": FACT_CHECKER_PROMPT,
+    "planner": PLANNER_PROMPT,
+}
+
+
+def input_tokens(prompt: str, text: str) -> int:
+    """システムプロンプトを含む1回の呼び出しの推定入力トークン数"""
+    system = next(system for prefix, system in SYSTEM_PROMPTS.items() if prompt.startswith(prefix))
+    return estimate_tokens(system + text)
+
+
+def _sample_verdicts(sketch_result: dict, matcher_result: dict) -> tuple[ExaminationVerdict, FactCheckVerdict]:
+    """下流のプロンプトに渡す判定（両形式で同じ内容）"""
+    mapping = matcher_result.get("r_group_mapping", {})
+    verdict = ExaminationVerdict(
+        groups=[
+            GroupVerdict(group_id=group_id, value=mapping.get(short_group_id(group_id), "N/A"), satisfied=True, reason="")
+            for group_id in sketch_result["claim_requirements"]
+        ],
+        overall="PROTECTED",
+        confidence=1.0,
+        evidence=["Claim 1"]
+    )
+    fact_check = FactCheckVerdict(consistent=True, verified_facts=["Claim 1"], discrepancies=[], confidence=1.0)
+    return verdict, fact_check
+
+
+def case_prompts(case: dict) -> dict[str, str]:
+    """1ケース分の全プロンプト（プロンプト名 → 本文）を現在の形式で作成"""
+    query, patent = case["query_molecule"], case["patent_info"]
+    sketch = extract_markush_structure(patent)
+    matcher = match_substituents(query, sketch)
+    markush = sketch["core_markush_smiles"]
+    verdict, fact_check = _sample_verdicts(sketch, matcher)
+    mapping = matcher.get("r_group_mapping", {})
+
+    prompts = {
+        "examinator": examination_prompt(markush, query, matcher, patent),
+        "examinator_structured": examination_prompt(markush, query, matcher, patent, structured=True),
+        "examinator_batch_item": batch_prompt(markush, [(query, matcher)], [0], patent),
+        "fact_checker_structured": fact_check_prompt(query, patent, True, format_verdict(verdict), structured=True),
+        "planner": report_prompt(query, patent, sketch, matcher, verdict, fact_check),
+        "planner_structured": report_prompt(query, patent, sketch, matcher, verdict, fact_check, structured=True),
+        "planner_fused": verified_report_prompt(query, patent, sketch, matcher, verdict),
+    }
+    for group_id, requirement in sketch["claim_requirements"].items():
+        prompts[f"examinator_group_{short_group_id(group_id)}"] = group_prompt(
+            markush, query, group_id, mapping.get(short_group_id(group_id), "N/A"), requirement
+        )
+    return prompts
+
+
+def benchmark(cases: list[dict]) -> dict:
+    rows = []
+    for case in cases:
+        measured = {}
+        for label, name in FORMATS.items():
+            with use_payload_format(name):
+                measured[label] = {prompt: input_tokens(prompt, text) for prompt, text in case_prompts(case).items()}
+        for prompt in measured["before"]:
+            before, after = measured["before"][prompt], measured["after"][prompt]
+            row = {
+                "id": case["id"],
+                "prompt": prompt,
+                "before_est": before,
+                "after_est": after,
+                "saved_est": before - after,
+            }
+            rows.append(row)
+            print(json.dumps(row, ensure_ascii=False))
+
+    before = sum(row["before_est"] for row in rows)
+    after = sum(row["after_est"] for row in rows)
+    return {
+        "prompts": len(rows),
+        "before_tokens_est": before,
+        "after_tokens_est": after,
+        "saved_tokens_per_prompt_est": (before - after) / len(rows),
+        "reduction_est": 1 - after / before,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="プロンプトのトークン数をシリアライズ形式ごとに比較")
+    parser.add_argument("--cases", help="ベンチマークケースのJSONLファイル")
+    args = parser.parse_args()
+    summary = benchmark(load_cases(args.cases))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""ステージ単位のチェックポイント - 失敗したステージから評価を再開する
+
+ディレクトリ構成:
+    {CHECKPOINT_DIR}/{run_id}/meta.json      入力・実行オプション・昇格理由・ステージ入力のフィンガープリント
+    {CHECKPOINT_DIR}/{run_id}/{stage}.json   ステージの出力と所要時間
+
+各ファイルは一時ファイルへの書き込み後にos.replaceで置き換えるため、
+書き込み途中で中断されても壊れたチェックポイントは残らない。
+
+新しい実行を保存するたびに、最終更新からCHECKPOINT_TTL_SEC秒を過ぎた実行と、
+CHECKPOINT_MAX_RUNSを超えた分の古い実行を削除する（いずれも0で無制限）。
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Optional
+
+from agents.verdicts import decode_output, encode_output
+
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", ".checkpoints")
+CHECKPOINT_TTL_SEC = float(os.getenv("CHECKPOINT_TTL_SEC") or 7 * 24 * 3600)
+CHECKPOINT_MAX_RUNS = int(os.getenv("CHECKPOINT_MAX_RUNS") or 1000)
+
+
+def new_run_id() -> str:
+    """ランダムな実行IDを発行（UIからの実行用）"""
+    return uuid.uuid4().hex
+
+
+def content_run_id(query_molecule: str, patent_info: str, options: Any, config: dict) -> str:
+    """入力・オプション・評価設定から決まる実行ID（バッチ実行の再開用）
+
+    Args:
+        config: 結果に影響する設定（モデルID・出力トークン上限・プロンプト等、pipeline.run_config()）。
+            設定を変えた後の再実行では別の実行IDになり、古い結果を再利用しない
+    """
+    payload = json.dumps([query_molecule, patent_info, asdict(options), config], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def _atomic_write(path: Path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class CheckpointStore:
+    """実行IDごとにステージ出力を永続化するストア"""
+
+    def __init__(
+        self,
+        root: str = CHECKPOINT_DIR,
+        ttl: float = CHECKPOINT_TTL_SEC,
+        max_runs: int = CHECKPOINT_MAX_RUNS
+    ):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_runs = max_runs
+
+    def _dir(self, run_id: str) -> Path:
+        return self.root / run_id
+
+    def exists(self, run_id: str) -> bool:
+        return (self._dir(run_id) / "meta.json").exists()
+
+    def save_meta(self, run_id: str, meta: dict) -> None:
+        is_new = not self.exists(run_id)
+        _atomic_write(self._dir(run_id) / "meta.json", meta)
+        if is_new:
+            self.prune(keep=run_id)
+
+    def load_meta(self, run_id: str) -> dict:
+        return json.loads((self._dir(run_id) / "meta.json").read_text(encoding="utf-8"))
+
+    def save_stage(self, run_id: str, stage: str, output: Any, elapsed: float) -> None:
+        _atomic_write(self._dir(run_id) / f"{stage}.json", {"output": encode_output(output), "elapsed": elapsed})
+
+    def load_stages(self, run_id: str, stages: tuple[str, ...]) -> dict[str, tuple[Any, float]]:
+        """保存済みのステージ出力を取得（ステージ順で最初の欠落以降は読み込まない）
+
+        Returns:
+            ステージ名 → (出力, 所要時間)
+        """
+        loaded = {}
+        for stage in stages:
+            path = self._dir(run_id) / f"{stage}.json"
+            if not path.exists():
+                break
+            data = json.loads(path.read_text(encoding="utf-8"))
+            loaded[stage] = (decode_output(data["output"]), data["elapsed"])
+        return loaded
+
+    def delete(self, run_id: str) -> None:
+        """実行のチェックポイントを削除（同じ実行IDで最初からやり直す場合）"""
+        shutil.rmtree(self._dir(run_id), ignore_errors=True)
+
+    def list_runs(self) -> list[str]:
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir() if (p / "meta.json").exists())
+
+    def prune(self, keep: Optional[str] = None) -> list[str]:
+        """期限切れの実行と、上限を超えた分の古い実行を削除（最終更新はmeta.jsonの更新時刻）
+
+        Args:
+            keep: 削除しない実行ID（保存中の実行）
+
+        Returns:
+            削除した実行ID
+        """
+        if not self.root.exists():
+            return []
+        runs = []
+        for path in self.root.iterdir():
+            try:
+                runs.append((path.name, (path / "meta.json").stat().st_mtime))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+        runs.sort(key=lambda run: run[1], reverse=True)
+
+        now = time.time()
+        removed = []
+        for rank, (run_id, updated) in enumerate(runs):
+            if run_id == keep:
+                continue
+            expired = self.ttl and now - updated > self.ttl
+            over_limit = self.max_runs and rank >= self.max_runs
+            if expired or over_limit:
+                shutil.rmtree(self._dir(run_id), ignore_errors=True)
+                removed.append(run_id)
+        return removed
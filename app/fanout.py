@@ -0,0 +1,195 @@
+"""複数特許ファンアウト - 1つのクエリ分子を複数の候補特許に対して評価
+
+1. 全特許のSketch Extractor / Substituents Matcherを並列実行
+2. マッチャーのTanimoto類似度の高い順にLLMステージ（Examinator以降）を実行
+3. 「最初のPROTECTEDで停止」ポリシーでは、PROTECTED判定が出た時点で残りの処理をキャンセル
+
+各特許の評価には共通の親トークンの子トークンを割り当てるため、停止時は実行中のLLM呼び出しも中断され、
+ワーカーのスロットはすぐに解放される。評価の期限（ASSESSMENT_DEADLINE_SEC）は特許ごとに、
+LLMステージがキューから取り出された時点から数える（キューの後方の特許が待ち時間で期限切れにならない）。
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+from agents.cancellation import AssessmentCancelled, CancellationToken
+from checkpoint import CheckpointStore
+from pipeline import (
+    ASSESSMENT_DEADLINE_SEC,
+    STAGES,
+    AssessmentRun,
+    PipelineOptions,
+    assessment_run_id,
+    run_stage,
+    start_run
+)
+
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "8"))
+# LLMステージの同時実行数（モデルのスロットリングに合わせて調整）
+FANOUT_LLM_WORKERS = int(os.getenv("FANOUT_LLM_WORKERS", "4"))
+
+PRE_LLM_STAGES = ("sketch", "matcher")
+LLM_STAGES = tuple(stage for stage in STAGES if stage not in PRE_LLM_STAGES)
+
+
+@dataclass
+class FanoutResult:
+    """1特許分の評価結果"""
+    patent_id: str
+    run: AssessmentRun
+    status: str = "pending"  # completed / no_skeleton_match / cancelled / error
+    error: Optional[str] = None
+    elapsed: float = 0.0
+
+    @property
+    def similarity(self) -> float:
+        return self.run.outputs.get("matcher", {}).get("tanimoto_similarity", 0.0)
+
+    @property
+    def verdict(self) -> str:
+        """判定（レポート作成前に中断した場合もRequirements Examinatorの判定があれば表示）"""
+        if self.status == "no_skeleton_match":
+            return "NOT_PROTECTED"
+        if "examinator" not in self.run.outputs:
+            return "-"
+        verdict = "PROTECTED" if self.run.is_protected else "NOT_PROTECTED"
+        if self.status != "completed":
+            return f"{verdict} (report {self.status})"
+        return verdict
+
+
+def _prepare(result: FanoutResult) -> FanoutResult:
+    start = time.perf_counter()
+    try:
+        for stage in PRE_LLM_STAGES:
+            if stage not in result.run.outputs:
+                run_stage(result.run, stage)
+        if not result.run.outputs["matcher"].get("skeleton_match", False):
+            # 骨格が一致しない特許はLLMで評価するまでもなく保護範囲外
+            result.status = "no_skeleton_match"
+    except AssessmentCancelled as e:
+        result.status, result.error = "cancelled", str(e)
+    except Exception as e:
+        result.status, result.error = "error", str(e)
+    result.elapsed += time.perf_counter() - start
+    return result
+
+
+def _assess(
+    result: FanoutResult,
+    others: list[FanoutResult],
+    stop_at_first_protected: bool,
+    first_protected: threading.Lock
+) -> FanoutResult:
+    start = time.perf_counter()
+    # 評価ごとの期限はキューから取り出された時点から数える
+    result.run.token = result.run.token.child(ASSESSMENT_DEADLINE_SEC or None)
+    try:
+        for stage in LLM_STAGES:
+            if stage not in result.run.outputs:
+                run_stage(result.run, stage)
+            if (
+                stage == "examinator"
+                and stop_at_first_protected
+                and result.run.is_protected
+                and first_protected.acquire(blocking=False)
+            ):
+                # 最初にPROTECTEDとなった特許のみ、他の特許の評価を中断してレポートを最後まで作成する
+                # （既にPROTECTEDと判定された特許は既知の該当として中断しない）
+                for other in others:
+                    if other is not result and not other.run.is_protected:
+                        other.run.token.cancel("stop_at_first_protected")
+        result.status = "completed"
+    except AssessmentCancelled as e:
+        result.status, result.error = "cancelled", str(e)
+    except Exception as e:
+        result.status, result.error = "error", str(e)
+    finally:
+        result.elapsed += time.perf_counter() - start
+    return result
+
+
+def assess_patents(
+    query_molecule: str,
+    patents: dict[str, str],
+    options: Optional[PipelineOptions] = None,
+    stop_at_first_protected: bool = False,
+    checkpoints: Optional[CheckpointStore] = None,
+    token: Optional[CancellationToken] = None,
+    fresh: bool = False
+) -> list[FanoutResult]:
+    """クエリ分子を複数の特許に対して評価
+
+    Args:
+        query_molecule: クエリ分子のSMILES文字列
+        patents: 特許ID → 特許クレームテキスト
+        options: パイプラインの実行オプション
+        stop_at_first_protected: Trueの場合、最初のPROTECTED判定で残りの評価をキャンセル
+        checkpoints: 指定した場合、入力・設定から決まる実行IDで各ステージを永続化し、
+            同じ入力・設定での再実行時は完了済みのステージを再利用する
+        token: 全体のキャンセルトークン（期限はバッチ全体の上限。省略時は期限なし）
+        fresh: Trueの場合、既存のチェックポイントを破棄して全特許を最初から評価する
+
+    Returns:
+        類似度順に並んだ特許ごとの評価結果
+    """
+    options = options or PipelineOptions()
+    token = token or CancellationToken()
+    results = []
+    for patent_id, patent_info in patents.items():
+        run_id = None
+        if checkpoints is not None:
+            run_id = assessment_run_id(query_molecule, patent_info, options)
+            if fresh:
+                checkpoints.delete(run_id)
+        results.append(FanoutResult(patent_id, start_run(
+            query_molecule,
+            patent_info,
+            options,
+            checkpoints=checkpoints,
+            run_id=run_id,
+            token=token.child()
+        )))
+
+    with ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS) as executor:
+        list(executor.map(_prepare, results))
+
+    candidates = sorted(
+        (result for result in results if result.status == "pending"),
+        key=lambda result: result.similarity,
+        reverse=True
+    )
+    # 類似度順に投入するため、同時実行数を超えた分は類似度の高い順に処理される
+    # キャンセル済みの評価は最初のステージ前に中断されるため、スロットを占有しない
+    first_protected = threading.Lock()
+    with ThreadPoolExecutor(max_workers=FANOUT_LLM_WORKERS) as executor:
+        for result in candidates:
+            executor.submit(_assess, result, candidates, stop_at_first_protected, first_protected)
+
+    return sorted(results, key=lambda result: result.similarity, reverse=True)
+
+
+def summary_table(results: list[FanoutResult]) -> list[dict]:
+    """評価結果をランク付きの表（辞書リスト）に変換
+
+    PROTECTEDを先頭に、同じ判定内では類似度の高い順に並べる。
+    """
+    ranked = sorted(
+        results,
+        key=lambda result: (not result.verdict.startswith("PROTECTED"), -result.similarity)
+    )
+    return [
+        {
+            "rank": rank,
+            "patent_id": result.patent_id,
+            "verdict": result.verdict,
+            "similarity": result.similarity,
+            "status": result.status,
+            "elapsed_sec": round(result.elapsed, 2),
+            "error": result.error or "",
+        }
+        for rank, result in enumerate(ranked, start=1)
+    ]
@@ -0,0 +1,211 @@
+"""負荷試験 - 同時に利用するアナリストを模擬し、1コンテナで捌けるセッション数を見積もる
+
+各セッションはStreamlitのスクリプト実行と同様に専用スレッドで評価パイプラインを実行する。
+入力はsample_data.pyの2分子とクレーム、LLMはローカルの疑似モデル（遅延を指定）で置き換える。
+
+使い方:
+    python loadtest.py [--sessions 1,2,4,8,16,32] [--assessments 3] [--latency 1.0] [--jitter 0.2]
+                       [--capacity 0] [--think-time 0] [--structured | --fused | --per-group]
+
+同時セッション数ごとに以下を出力する:
+- 評価1件のエンドツーエンドのレイテンシ（p50 / p95 / p99）
+- 待ち時間: 要求から実行開始まで（--capacityで同時実行数を制限した場合）
+- セッションあたりのCPU時間とメモリ増分（RSSの最大値 - 開始時）
+- スループット（評価/秒）
+
+飽和点は、p95が最初の段階のp95の--saturation-factor倍を超えるか、スループットの増加率が
+セッション数の増加率の--min-scaling倍を下回った（スループットが頭打ちになった）最初のセッション数とする。
+"""
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from agents.fake_model import FAKE_MODEL_JITTER_SEC, FAKE_MODEL_LATENCY_SEC, FakeModel
+from agents.llm import use_fake_model
+from pipeline import PipelineOptions, run_assessment
+from sample_data import SAMPLE_PATENT_CLAIM, SAMPLE_PROTECTED_MOLECULE, SAMPLE_QUERY_MOLECULE
+
+MOLECULES = (SAMPLE_QUERY_MOLECULE, SAMPLE_PROTECTED_MOLECULE)
+
+# RSSの最大値を記録する間隔（秒）
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def _rss_bytes() -> int:
+    """プロセスの現在の常駐メモリ（Linuxの/procから取得）"""
+    pages = int(Path("/proc/self/statm").read_text().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+class _RssSampler:
+    """バックグラウンドでRSSの最大値を記録"""
+
+    def __init__(self):
+        self.baseline = _rss_bytes()
+        self.peak = self.baseline
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self) -> "_RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+@dataclass
+class SessionStats:
+    """1セッション分の計測値"""
+    latencies: list[float] = field(default_factory=list)
+    queue_delays: list[float] = field(default_factory=list)
+    cpu_sec: float = 0.0
+    errors: int = 0
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _session(
+    index: int,
+    assessments: int,
+    options: PipelineOptions,
+    slots: Optional[threading.Semaphore],
+    think_time: float
+) -> SessionStats:
+    stats = SessionStats()
+    cpu_start = time.thread_time()
+    for i in range(assessments):
+        molecule = MOLECULES[(index + i) % len(MOLECULES)]
+        requested = time.perf_counter()
+        if slots is not None:
+            slots.acquire()
+        started = time.perf_counter()
+        try:
+            run = run_assessment(molecule, SAMPLE_PATENT_CLAIM, options)
+            if run.aborted or not run.completed:
+                stats.errors += 1
+        except Exception:
+            stats.errors += 1
+        finally:
+            if slots is not None:
+                slots.release()
+        finished = time.perf_counter()
+        stats.queue_delays.append(started - requested)
+        stats.latencies.append(finished - requested)
+        if think_time:
+            time.sleep(think_time)
+    # パイプラインはセッションのスレッドで実行されるため、スレッドのCPU時間をセッションの消費とする
+    # （R基ごとの並列評価のワーカースレッド分は含まない）
+    stats.cpu_sec = time.thread_time() - cpu_start
+    return stats
+
+
+def run_level(
+    sessions: int,
+    assessments: int,
+    options: PipelineOptions,
+    capacity: int = 0,
+    think_time: float = 0.0
+) -> dict:
+    """同時セッション数sessionsで負荷をかけ、計測値を集計"""
+    slots = threading.Semaphore(capacity) if capacity else None
+    results: list[Optional[SessionStats]] = [None] * sessions
+
+    def target(index: int) -> None:
+        results[index] = _session(index, assessments, options, slots, think_time)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(sessions)]
+    with _RssSampler() as rss:
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    latencies = [value for stats in results for value in stats.latencies]
+    queue_delays = [value for stats in results for value in stats.queue_delays]
+    return {
+        "sessions": sessions,
+        "assessments": len(latencies),
+        "errors": sum(stats.errors for stats in results),
+        "p50_sec": _percentile(latencies, 0.50),
+        "p95_sec": _percentile(latencies, 0.95),
+        "p99_sec": _percentile(latencies, 0.99),
+        "queue_p50_sec": _percentile(queue_delays, 0.50),
+        "queue_p95_sec": _percentile(queue_delays, 0.95),
+        "cpu_sec_per_session": statistics.mean(stats.cpu_sec for stats in results),
+        "rss_mb_per_session": (rss.peak - rss.baseline) / sessions / 2**20,
+        "throughput_per_sec": len(latencies) / elapsed,
+    }
+
+
+def find_saturation(rows: list[dict], factor: float, min_scaling: float) -> Optional[int]:
+    """p95の悪化、スループットの頭打ち、またはエラーが最初に起きたセッション数（起きなければNone）"""
+    baseline = rows[0]["p95_sec"]
+    for previous, row in zip(rows, rows[1:]):
+        throughput_gain = row["throughput_per_sec"] / previous["throughput_per_sec"] - 1
+        sessions_gain = row["sessions"] / previous["sessions"] - 1
+        if (
+            row["p95_sec"] > baseline * factor
+            or throughput_gain < sessions_gain * min_scaling
+            or row["errors"]
+        ):
+            return row["sessions"]
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="同時セッション数ごとの評価パイプラインの負荷試験")
+    parser.add_argument("--sessions", default="1,2,4,8,16,32", help="同時セッション数（カンマ区切りで段階的に増加）")
+    parser.add_argument("--assessments", type=int, default=3, help="セッションごとの評価回数")
+    parser.add_argument("--latency", type=float, default=FAKE_MODEL_LATENCY_SEC, help="疑似モデルの応答遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=FAKE_MODEL_JITTER_SEC, help="疑似モデルの遅延のばらつき（秒）")
+    parser.add_argument("--capacity", type=int, default=0, help="同時に実行する評価数の上限（0で無制限）")
+    parser.add_argument("--think-time", type=float, default=0.0, help="評価の間の待ち時間（秒）")
+    parser.add_argument("--saturation-factor", type=float, default=1.5, help="飽和とみなすp95の悪化倍率")
+    parser.add_argument("--min-scaling", type=float, default=0.5, help="セッション数の増加率に対するスループット増加率の下限")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--structured", action="store_true", help="構造化出力モード")
+    mode.add_argument("--fused", action="store_true", help="融合モード")
+    mode.add_argument("--per-group", action="store_true", help="R基ごとの並列評価モード")
+    args = parser.parse_args()
+
+    use_fake_model(FakeModel(args.latency, args.jitter))
+    options = PipelineOptions(structured=args.structured, fused=args.fused, per_group=args.per_group)
+
+    rows = []
+    for sessions in (int(value) for value in args.sessions.split(",")):
+        row = run_level(sessions, args.assessments, options, args.capacity, args.think_time)
+        rows.append(row)
+        print(json.dumps(row, ensure_ascii=False))
+
+    saturation = find_saturation(rows, args.saturation_factor, args.min_scaling)
+    print(json.dumps({
+        "saturation_sessions": saturation,
+        "max_sessions_before_saturation": (
+            max((row["sessions"] for row in rows if row["sessions"] < saturation), default=None)
+            if saturation is not None else rows[-1]["sessions"]
+        ),
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,37 @@
 論文再現: Intelligent System for Automated Molecular Patent Infringement Assessment
 (arXiv:2412.07819v2)
 """
+import warnings
+
 import streamlit as st
 from dotenv import load_dotenv
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 from agents import (
-    plan_and_coordinate,
-    extract_markush_structure,
-    match_substituents,
-    examine_requirements,
-    check_facts
+    ExaminationVerdict,
+    FactCheckVerdict,
+    InfringementReport,
+    VerifiedReport,
+    render_examination_markdown,
+    render_fact_check_markdown,
+    render_report_markdown
+)
+from agents.cache import get_cache
+from agents.cancellation import AssessmentCancelled, use_token
+from agents.cascade import CASCADE_STATS
+from checkpoint import CheckpointStore
+from fanout import assess_patents, summary_table
+from pipeline import (
+    ASSESSMENT_DEADLINE_SEC,
+    AssessmentRun,
+    PipelineOptions,
+    load_run,
+    new_assessment_token,
+    run_stage,
+    start_run
 )
+from series import assess_series, series_table
 from sample_data import (
     SAMPLE_QUERY_MOLECULE,
     SAMPLE_PATENT_CLAIM,
@@ -22,6 +43,27 @@ from sample_data import (
 
 load_dotenv()
 
+CHECKPOINTS = CheckpointStore()
+
+
+def to_markdown(result) -> str:
+    """エージェント出力を表示用のMarkdownに変換（構造化出力の場合のみ変換が必要）"""
+    if isinstance(result, ExaminationVerdict):
+        return render_examination_markdown(result)
+    if isinstance(result, FactCheckVerdict):
+        return render_fact_check_markdown(result)
+    if isinstance(result, VerifiedReport):
+        return render_fact_check_markdown(result.fact_check)
+    if isinstance(result, InfringementReport):
+        return render_report_markdown(result)
+    return result
+
+
+def show_escalation(run: AssessmentRun, stage: str) -> None:
+    """カスケード実行時、強いモデルへ昇格したステージを表示"""
+    if stage in run.escalations:
+        st.caption(f"⬆️ 強いモデルへ昇格: {', '.join(run.escalations[stage])}")
+
 st.set_page_config(
     page_title="PatentFinder",
     page_icon="🔬",
@@ -51,9 +93,59 @@ with st.sidebar:
     
     st.divider()
     
+    st.header("実行オプション")
+    structured_mode = st.toggle(
+        "構造化出力モード",
+        value=False,
+        help="Requirements Examinator / Fact Checker / Plannerがスキーマ検証済みの判定オブジェクトを返します（出力が短く高速）"
+    )
+    cascade_mode = st.toggle(
+        "モデルカスケード",
+        value=False,
+        help="各ステージを小型モデルで実行し、確信度が低い・マッチャー不一致・事実不整合の場合のみ強いモデルへ昇格します（構造化出力を使用）"
+    )
+    fused_mode = st.toggle(
+        "融合モード（事実検証＋レポート）",
+        value=False,
+        help="Fact CheckerとPlannerを1回のLLM呼び出しにまとめ、逐次の往復を1回減らします（構造化出力を使用）"
+    )
+    per_group_mode = st.toggle(
+        "R基ごとの並列評価",
+        value=False,
+        help="Requirements ExaminatorをR基ごとに独立・並列に実行し、結果を集約します（いずれかのR基が不適合なら残りをキャンセル）"
+    )
+    incremental_mode = st.toggle(
+        "前回の結果を再利用",
+        value=True,
+        help="前回の評価と入力が同一のステージを再実行しません（分子のみの変更ではMarkush構造抽出を、コア構造が変わらないクレームの修正では置換基マッチングを再利用）"
+    )
+    if cascade_mode:
+        with st.expander("📊 カスケード統計"):
+            st.dataframe(CASCADE_STATS.summary(), use_container_width=True)
+    cache_stats = get_cache().stats()
+    if cache_stats:
+        with st.expander("🗄️ 共有キャッシュ（レプリカ別ヒット率）"):
+            st.dataframe(cache_stats, use_container_width=True)
+    
+    with st.form("resume_form"):
+        resume_input = st.text_input(
+            "実行IDを指定して再開",
+            help="タブを閉じた場合なども、実行IDを指定すれば完了済みのステージを再実行せずに再開できます"
+        )
+        resume_run_id = resume_input.strip() if st.form_submit_button("▶️ 再開") else ""
+    
+    st.divider()
+    
     with st.expander("📖 拡張SMILES形式について"):
         st.markdown(EXTENDED_SMILES_EXPLANATION)
 
+pipeline_options = PipelineOptions(
+    structured=structured_mode,
+    cascade=cascade_mode,
+    fused=fused_mode,
+    per_group=per_group_mode
+)
+
 # メイン入力
 col1, col2 = st.columns(2)
 
@@ -104,97 +196,260 @@ with col2:
 
 st.divider()
 
+def show_sketch(run: AssessmentRun, sketch_result: dict) -> None:
+    st.markdown("**抽出結果 (ダミー - MarkushParser + PDF Parser):**")
+    st.markdown(f"**コアMarkush構造:**")
+    st.code(sketch_result['core_markush_smiles'])
+    st.markdown("**クレーム要件:**")
+    for key, value in sketch_result["claim_requirements"].items():
+        st.markdown(f"- **{key}**: {value}")
+
+
+def show_matcher(run: AssessmentRun, matcher_result: dict) -> None:
+    st.markdown("**並列処理結果:**")
+    
+    col_rdkit, col_nn = st.columns(2)
+    
+    with col_rdkit:
+        st.markdown("**🔧 RDKit (ルールベース):**")
+        rdkit_result = matcher_result.get("rdkit_result", {})
+        for key, value in rdkit_result.get("r_group_mapping", {}).items():
+            st.markdown(f"- {key}: `{value}`")
+        st.caption(f"Confidence: {rdkit_result.get('confidence', 'N/A')}")
+    
+    with col_nn:
+        st.markdown("**🧠 MarkushMatcher (NN):**")
+        nn_result = matcher_result.get("nn_result", {})
+        for key, value in nn_result.get("r_group_mapping", {}).items():
+            st.markdown(f"- {key}: `{value}`")
+        st.caption(f"Confidence: {nn_result.get('confidence', 'N/A')}")
+    
+    st.markdown("---")
+    st.markdown("**✅ 検証済み統合結果 (LLMによる検証):**")
+    for key, value in matcher_result["r_group_mapping"].items():
+        st.markdown(f"- **{key}**: `{value}`")
+    
+    st.markdown(f"**Tanimoto類似度:** {matcher_result['tanimoto_similarity']}")
+    st.caption(matcher_result.get("verification_notes", ""))
+
+
+def show_examinator(run: AssessmentRun, examinator_result) -> None:
+    st.markdown("**評価結果 (Requirements Examinator - LLM):**")
+    st.markdown(to_markdown(examinator_result))
+    show_escalation(run, "examinator")
+
+
+def show_fact_checker(run: AssessmentRun, fact_check_result) -> None:
+    st.markdown("**検証結果 (Fact Checker - LLM):**")
+    st.markdown(to_markdown(fact_check_result))
+    show_escalation(run, "fact_checker")
+    if run.escalations.get("examinator") == ["fact_check_discrepancy"]:
+        st.warning("事実検証で不整合が検出されたため、要件評価を強いモデルで再実行しました")
+        st.markdown(to_markdown(run.outputs["examinator"]))
+    st.caption("※ Fact Checkerは推論の根拠が特許文書に存在するかを検証します（判定の正誤ではない）")
+
+
+def show_planner(run: AssessmentRun, final_report) -> None:
+    st.markdown("**最終侵害レポート (Planner - LLM):**")
+    st.markdown(to_markdown(final_report))
+    if run.options.fused:
+        st.caption("⚡ 融合モード: Step 4の事実検証と同じLLM呼び出しで作成")
+    show_escalation(run, "planner")
+
+
+# ステージ名 → (実行中ラベル, 完了ラベル, 表示関数)
+STAGE_VIEWS = {
+    "sketch": ("📐 Step 1: Markush構造を抽出中...", "✅ Step 1: Markush構造抽出完了", show_sketch),
+    "matcher": ("🔗 Step 2: 置換基グループをマッチング中...", "✅ Step 2: 置換基マッチング完了", show_matcher),
+    "examinator": ("🔬 Step 3: 要件適合性を評価中...", "✅ Step 3: 要件評価完了", show_examinator),
+    "fact_checker": ("✅ Step 4: 出力を検証中...", "✅ Step 4: 事実検証完了", show_fact_checker),
+    "planner": ("🎯 Step 5: 侵害レポートを作成中...", "✅ Step 5: レポート作成完了", show_planner),
+}
+
+
+# 再実行要求の検出に使うStreamlit内部の属性が見つからなかったことを警告済みか
+_script_state_warned = False
+
+
+def _script_request_state(ctx) -> str:
+    """スクリプトへの再実行・停止要求の状態（"RERUN" / "STOP" 等）
+
+    公開APIがないためStreamlit内部のScriptRequests._stateを参照する。バージョンアップで
+    属性がなくなった場合は一度だけ警告し、セッション切断の検出のみで動作する。
+    """
+    global _script_state_warned
+    state = getattr(getattr(ctx, "script_requests", None), "_state", None)
+    if state is None:
+        if not _script_state_warned:
+            _script_state_warned = True
+            warnings.warn(
+                f"streamlit {st.__version__}: ScriptRequests._stateが見つからないため、"
+                "再実行・停止要求による評価のキャンセルを無効にします"
+            )
+        return ""
+    return getattr(state, "name", "")
+
+
+def new_session_token(timeout: float = ASSESSMENT_DEADLINE_SEC):
+    """このセッション用の評価トークンを発行（timeoutに0を指定すると期限なし）
+    
+    Streamlitは再実行要求（ボタンの再クリック等）やタブを閉じた後も、実行中のスクリプトが
+    次のst呼び出しに到達するまで停止しない。そのため、トークンの確認時にセッションの状態を調べ、
+    再実行・停止が要求されている場合やセッションが切断されている場合はキャンセルする。
+    """
+    ctx = get_script_run_ctx()
+    
+    def abandoned() -> bool:
+        if ctx is None:
+            return False
+        if _script_request_state(ctx) in ("RERUN", "STOP"):
+            return True
+        return runtime.exists() and not runtime.get_instance().is_active_session(ctx.session_id)
+    
+    return new_assessment_token(timeout, cancel_when=abandoned)
+
+
+def show_partial_report(run: AssessmentRun, stage: str, reason: str) -> None:
+    """キャンセル・タイムアウトで中断した評価の部分的な結果を表示"""
+    st.warning(f"Step「{stage}」で評価を中断しました（{reason}）。完了済みのステージまでの結果を表示します。")
+    completed = [name for name in STAGE_VIEWS if name in run.outputs]
+    st.markdown(f"**完了済みステージ:** {', '.join(completed) or '（なし）'}")
+    if run.is_protected is not None:
+        verdict = "PROTECTED" if run.is_protected else "NOT PROTECTED"
+        st.markdown(f"**暫定判定 (Requirements Examinator):** {verdict}")
+    st.caption(f"実行ID `{run.run_id}` を指定すれば、完了済みのステージを再実行せずに再開できます。")
+
+
+def execute_run(run: AssessmentRun) -> None:
+    """全ステージを表示しながら実行
+
+    チェックポイント済みのステージは再実行しない。「前回の結果を再利用」が有効な場合は、
+    このセッションの前回の評価と入力が同一のステージも再実行しない。
+    """
+    previous = st.session_state.get("previous_run") if incremental_mode else None
+    st.session_state.previous_run = run
+    st.caption(f"実行ID: `{run.run_id}`")
+    for stage, (running_label, done_label, show) in STAGE_VIEWS.items():
+        with st.status(running_label, expanded=True) as status:
+            if stage in run.outputs:
+                result = run.outputs[stage]
+                st.caption("♻️ チェックポイントから復元")
+            else:
+                try:
+                    result = run_stage(run, stage, previous)
+                except AssessmentCancelled as e:
+                    status.update(label=f"⏹️ {running_label.rstrip('.')} を中断", state="error")
+                    show_partial_report(run, stage, str(e))
+                    return
+                except Exception as e:
+                    status.update(label=f"❌ {running_label.rstrip('.')} に失敗", state="error")
+                    st.session_state.failed_run_id = run.run_id
+                    st.error(f"{e}\n\n「▶️ 失敗したステージから再開」で、完了済みのステージを再実行せずに再開できます。")
+                    return
+                if stage in run.reused:
+                    st.caption(f"♻️ 前回の評価と入力が同一のため再利用（約{run.reused[stage]:.1f}秒短縮）")
+            show(run, result)
+            status.update(label=done_label, state="complete")
+    
+    st.session_state.pop("failed_run_id", None)
+    if run.reused:
+        st.info(
+            f"♻️ 再利用したステージ: {', '.join(run.reused)}"
+            f"（合計 約{sum(run.reused.values()):.1f}秒短縮）"
+        )
+    st.success("特許侵害評価が完了しました!")
+    st.balloons()
+
+
+resume_clicked = (
+    "failed_run_id" in st.session_state
+    and st.button("▶️ 失敗したステージから再開", use_container_width=True)
+)
+
 if st.button("🔍 特許侵害評価を開始", type="primary", use_container_width=True):
     if not query_molecule or not query_molecule.strip():
         st.error("クエリ分子を入力してください")
     elif not patent_info or not patent_info.strip():
         st.error("特許情報を入力してください")
     else:
-        # Step 1: Sketch Extractor (ダミー)
-        with st.status("📐 Step 1: Markush構造を抽出中...", expanded=True) as status:
-            sketch_result = extract_markush_structure(patent_info)
-            st.markdown("**抽出結果 (ダミー - MarkushParser + PDF Parser):**")
-            st.markdown(f"**コアMarkush構造:**")
-            st.code(sketch_result['core_markush_smiles'])
-            st.markdown("**クレーム要件:**")
-            for key, value in sketch_result["claim_requirements"].items():
-                st.markdown(f"- **{key}**: {value}")
-            status.update(label="✅ Step 1: Markush構造抽出完了", state="complete")
-        
-        # Step 2: Substituents Matcher (ダミー)
-        with st.status("🔗 Step 2: 置換基グループをマッチング中...", expanded=True) as status:
-            matcher_result = match_substituents(query_molecule, sketch_result)
-            
-            st.markdown("**並列処理結果:**")
-            
-            col_rdkit, col_nn = st.columns(2)
-            
-            with col_rdkit:
-                st.markdown("**🔧 RDKit (ルールベース):**")
-                rdkit_result = matcher_result.get("rdkit_result", {})
-                for key, value in rdkit_result.get("r_group_mapping", {}).items():
-                    st.markdown(f"- {key}: `{value}`")
-                st.caption(f"Confidence: {rdkit_result.get('confidence', 'N/A')}")
-            
-            with col_nn:
-                st.markdown("**🧠 MarkushMatcher (NN):**")
-                nn_result = matcher_result.get("nn_result", {})
-                for key, value in nn_result.get("r_group_mapping", {}).items():
-                    st.markdown(f"- {key}: `{value}`")
-                st.caption(f"Confidence: {nn_result.get('confidence', 'N/A')}")
-            
-            st.markdown("---")
-            st.markdown("**✅ 検証済み統合結果 (LLMによる検証):**")
-            for key, value in matcher_result["r_group_mapping"].items():
-                st.markdown(f"- **{key}**: `{value}`")
-            
-            st.markdown(f"**Tanimoto類似度:** {matcher_result['tanimoto_similarity']}")
-            st.caption(matcher_result.get("verification_notes", ""))
-            status.update(label="✅ Step 2: 置換基マッチング完了", state="complete")
-        
-        # Step 3: Requirements Examinator
-        with st.status("🔬 Step 3: 要件適合性を評価中...", expanded=True) as status:
-            examinator_result = examine_requirements(
-                sketch_result["core_markush_smiles"],
-                query_molecule,
-                matcher_result,
-                patent_info
-            )
-            st.markdown("**評価結果 (Requirements Examinator - LLM):**")
-            st.markdown(examinator_result)
-            status.update(label="✅ Step 3: 要件評価完了", state="complete")
-        
-        # Step 4: Fact Checker
-        with st.status("✅ Step 4: 出力を検証中...", expanded=True) as status:
-            is_protected = "not_protected" not in examinator_result.lower() and "not protected" not in examinator_result.lower() and "保護されていない" not in examinator_result
-            
-            fact_check_result = check_facts(
-                query_molecule,
-                patent_info,
-                is_protected,
-                examinator_result
-            )
-            st.markdown("**検証結果 (Fact Checker - LLM):**")
-            st.markdown(fact_check_result)
-            st.caption("※ Fact Checkerは推論の根拠が特許文書に存在するかを検証します（判定の正誤ではない）")
-            status.update(label="✅ Step 4: 事実検証完了", state="complete")
-        
-        # Step 5: Planner - 最終レポート作成
-        with st.status("🎯 Step 5: 侵害レポートを作成中...", expanded=True) as status:
-            final_report = plan_and_coordinate(
-                query_molecule,
-                patent_info,
-                sketch_result,
-                matcher_result,
-                examinator_result,
-                fact_check_result
-            )
-            st.markdown("**最終侵害レポート (Planner - LLM):**")
-            st.markdown(final_report)
-            status.update(label="✅ Step 5: レポート作成完了", state="complete")
-        
-        st.success("特許侵害評価が完了しました!")
-        st.balloons()
+        execute_run(start_run(
+            query_molecule,
+            patent_info,
+            pipeline_options,
+            checkpoints=CHECKPOINTS,
+            token=new_session_token()
+        ))
+elif resume_clicked:
+    execute_run(load_run(st.session_state.failed_run_id, CHECKPOINTS, new_session_token()))
+elif resume_run_id:
+    if CHECKPOINTS.exists(resume_run_id):
+        execute_run(load_run(resume_run_id, CHECKPOINTS, new_session_token()))
+    else:
+        st.error(f"実行ID `{resume_run_id}` のチェックポイントが見つかりません")
+
+# 複数特許の一括評価（FTOチェック）
+st.divider()
+with st.expander("📚 複数特許の一括評価（FTOチェック）"):
+    patent_files = st.file_uploader(
+        "特許クレームファイル（1ファイル1特許、.txt / .md）:",
+        type=["txt", "md"],
+        accept_multiple_files=True
+    )
+    stop_at_first_protected = st.checkbox(
+        "最初のPROTECTEDで停止",
+        value=False,
+        help="PROTECTED判定が出た時点で残りの特許の評価をキャンセルします"
+    )
+    fresh_run = st.checkbox(
+        "チェックポイントを再利用せずに再評価",
+        value=False,
+        help="同じ特許・設定の完了済みの評価結果を破棄し、全特許を最初から評価します"
+    )
+    if st.button("🔍 一括評価を開始", use_container_width=True):
+        if not query_molecule or not query_molecule.strip():
+            st.error("クエリ分子を入力してください")
+        elif not patent_files:
+            st.error("特許クレームファイルをアップロードしてください")
+        else:
+            patents = {f.name: f.getvalue().decode("utf-8") for f in patent_files}
+            with st.spinner(f"{len(patents)}件の特許を評価中..."):
+                fanout_results = assess_patents(
+                    query_molecule,
+                    patents,
+                    pipeline_options,
+                    stop_at_first_protected=stop_at_first_protected,
+                    checkpoints=CHECKPOINTS,
+                    fresh=fresh_run,
+                    # 期限は特許ごとに設けるため、バッチ全体のトークンには期限を設けない
+                    token=new_session_token(timeout=0)
+                )
+            st.dataframe(summary_table(fanout_results), use_container_width=True)
+            for result in fanout_results:
+                if result.status == "completed":
+                    with st.expander(f"{result.patent_id}: {result.verdict}"):
+                        st.markdown(to_markdown(result.run.outputs["planner"]))
+
+# 類縁体シリーズの一括評価
+with st.expander("🧪 類縁体シリーズの一括評価"):
+    series_input = st.text_area(
+        "クエリ分子（1行に1つのSMILES）:",
+        height=150,
+        key="series_input"
+    )
+    if st.button("🔍 シリーズ評価を開始", use_container_width=True):
+        molecules = [line.strip() for line in series_input.splitlines() if line.strip()]
+        if not molecules:
+            st.error("クエリ分子を入力してください")
+        elif not patent_info or not patent_info.strip():
+            st.error("特許情報を入力してください")
+        else:
+            try:
+                with st.spinner(f"{len(molecules)}分子をバッチ評価中..."), use_token(new_session_token()):
+                    series_results = assess_series(molecules, patent_info)
+            except AssessmentCancelled as e:
+                st.warning(f"シリーズ評価を中断しました（{e}）")
+            else:
+                st.dataframe(series_table(series_results), use_container_width=True)
 
 # フッター
 st.divider()
@@ -0,0 +1,514 @@
+"""評価パイプライン - UIとバッチ実行で共有する5ステージの実行ロジック
+
+Step 1: Sketch Extractor → Step 2: Substituents Matcher → Step 3: Requirements Examinator
+→ Step 4: Fact Checker → Step 5: Planner
+
+各ステージの入力（上流ステージの出力を含む）はフィンガープリントとして記録し、
+前回の評価と入力が同一のステージは再実行せずに前回の出力を再利用する（インクリメンタル再評価）。
+"""
+import hashlib
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+from agents import (
+    plan_and_coordinate,
+    extract_markush_structure,
+    match_substituents,
+    examine_requirements,
+    examine_requirements_per_group,
+    check_facts,
+    verify_and_report,
+    examination_is_protected,
+    VerifiedReport
+)
+from agents.cascade import (
+    SMALL_TIER,
+    STRONG_TIER,
+    CASCADE_STATS,
+    cascade_enabled,
+    low_confidence,
+    matcher_branches_disagree,
+    run_cascade
+)
+from agents.cache import cache_key, get_cache
+from agents.payloads import current_payload_format, format_json, format_verdict
+from agents.verdicts import encode_output
+from agents.cancellation import AssessmentCancelled, CancellationToken, use_token
+from agents.examinator import EXAMINATOR_PROMPT, examination_prompt, group_inputs, group_prompt
+from agents.fact_checker import FACT_CHECKER_PROMPT, fact_check_prompt
+from agents.llm import STRUCTURED_MAX_TOKENS, get_model_id, track_usage
+from agents.planner import PLANNER_PROMPT, report_prompt, verified_report_prompt
+from checkpoint import CheckpointStore, content_run_id, new_run_id
+
+STAGES = ("sketch", "matcher", "examinator", "fact_checker", "planner")
+
+# 評価全体の期限と、1ステージあたりのタイムアウト（秒、0で無効）
+ASSESSMENT_DEADLINE_SEC = float(os.getenv("ASSESSMENT_DEADLINE_SEC", "600"))
+STAGE_TIMEOUT_SEC = float(os.getenv("STAGE_TIMEOUT_SEC", "180"))
+
+
+LLM_STAGES = ("examinator", "fact_checker", "planner")
+
+
+def run_config() -> dict:
+    """結果に影響する設定（解決後のモデルID・出力トークン上限・ペイロード形式・システムプロンプト）
+
+    content_run_idに含め、モデルやプロンプトを変更した後の再実行で古いチェックポイントを再利用しない。
+    """
+    return {
+        "models": {
+            stage: [get_model_id(stage), get_model_id(stage, SMALL_TIER), get_model_id(stage, STRONG_TIER)]
+            for stage in LLM_STAGES
+        },
+        "structured_max_tokens": STRUCTURED_MAX_TOKENS,
+        "payload_format": current_payload_format(),
+        "system_prompts": hashlib.sha256(
+            format_json([EXAMINATOR_PROMPT, FACT_CHECKER_PROMPT, PLANNER_PROMPT]).encode("utf-8")
+        ).hexdigest(),
+    }
+
+
+def assessment_run_id(query_molecule: str, patent_info: str, options: "PipelineOptions") -> str:
+    """入力・オプション・現在の設定（run_config）から決まる実行ID"""
+    return content_run_id(query_molecule, patent_info, options, run_config())
+
+
+def new_assessment_token(
+    timeout: float = ASSESSMENT_DEADLINE_SEC,
+    cancel_when: Optional[Callable[[], bool]] = None
+) -> CancellationToken:
+    """評価全体の期限付きキャンセルトークンを発行"""
+    return CancellationToken(timeout or None, cancel_when=cancel_when)
+
+
+@dataclass
+class PipelineOptions:
+    """実行オプション"""
+    structured: bool = False
+    # カスケードは構造化出力の確信度を使うため、有効時は構造化出力モードで実行する
+    cascade: bool = False
+    # 事実検証と最終レポートを1回の呼び出しで作成（構造化出力モードで実行する）
+    fused: bool = False
+    # Requirements ExaminatorをR基ごとに並列実行（構造化出力モードで実行する）
+    per_group: bool = False
+
+    @property
+    def use_structured(self) -> bool:
+        return self.structured or self.cascade or self.fused or self.per_group
+
+
+@dataclass
+class AssessmentRun:
+    """1件の評価の入力とステージごとの出力"""
+    query_molecule: str
+    patent_info: str
+    options: PipelineOptions = field(default_factory=PipelineOptions)
+    outputs: dict[str, Any] = field(default_factory=dict)
+    timings: dict[str, float] = field(default_factory=dict)
+    # ステージ名 → 強いモデルへ昇格した理由
+    escalations: dict[str, list[str]] = field(default_factory=dict)
+    run_id: str = field(default_factory=new_run_id)
+    # 指定した場合、各ステージの完了時に出力を永続化する
+    checkpoints: Optional[CheckpointStore] = None
+    # 全ステージとLLM呼び出しに伝搬するキャンセルトークン（評価全体の期限を含む）
+    token: CancellationToken = field(default_factory=new_assessment_token, repr=False)
+    # キャンセル・タイムアウトで中断した場合の {"stage": ..., "reason": ...}
+    aborted: Optional[dict] = None
+    # ステージ名 → 入力のフィンガープリント
+    fingerprints: dict[str, str] = field(default_factory=dict)
+    # ステージ名 → 前回の評価から再利用して短縮した時間（秒）
+    reused: dict[str, float] = field(default_factory=dict)
+    # ステージ名 → カスケードで採用した小型モデル呼び出しの使用量（後から昇格した場合に削減の見積もりを取り消す）
+    accepted_small_usage: dict[str, dict] = field(default_factory=dict, repr=False)
+
+    @property
+    def is_protected(self) -> Optional[bool]:
+        if "examinator" not in self.outputs:
+            return None
+        return examination_is_protected(self.outputs["examinator"])
+
+    @property
+    def completed(self) -> bool:
+        return all(stage in self.outputs for stage in STAGES)
+
+    @property
+    def next_stage(self) -> Optional[str]:
+        """最初の未完了ステージ"""
+        return next((stage for stage in STAGES if stage not in self.outputs), None)
+
+    def checkpoint(self, stage: Optional[str] = None) -> None:
+        """メタデータと（指定した場合は）ステージ出力を永続化"""
+        if self.checkpoints is None:
+            return
+        if stage is not None:
+            self.checkpoints.save_stage(self.run_id, stage, self.outputs[stage], self.timings.get(stage, 0.0))
+        self.checkpoints.save_meta(self.run_id, {
+            "query_molecule": self.query_molecule,
+            "patent_info": self.patent_info,
+            "options": asdict(self.options),
+            "escalations": self.escalations,
+            "fingerprints": self.fingerprints,
+            "reused": self.reused,
+        })
+
+
+def _examinator_reasoning(examinator_result) -> str:
+    if isinstance(examinator_result, BaseModel):
+        return format_verdict(examinator_result)
+    return examinator_result
+
+
+def _run_sketch(run: AssessmentRun):
+    # 同じクレームの抽出結果はレプリカ間で共有キャッシュから再利用する
+    return get_cache().get_or_compute(
+        cache_key("sketch", run.patent_info),
+        lambda: extract_markush_structure(run.patent_info)
+    )
+
+
+def _run_matcher(run: AssessmentRun):
+    return get_cache().get_or_compute(
+        cache_key("matcher", run.query_molecule, run.outputs["sketch"]),
+        lambda: match_substituents(run.query_molecule, run.outputs["sketch"])
+    )
+
+
+def _examine(run: AssessmentRun, tier: Optional[str] = None):
+    if run.options.per_group:
+        return examine_requirements_per_group(
+            run.outputs["sketch"]["core_markush_smiles"],
+            run.query_molecule,
+            run.outputs["matcher"],
+            run.outputs["sketch"]["claim_requirements"],
+            tier=tier
+        )
+    return examine_requirements(
+        run.outputs["sketch"]["core_markush_smiles"],
+        run.query_molecule,
+        run.outputs["matcher"],
+        run.patent_info,
+        structured=run.options.use_structured,
+        tier=tier
+    )
+
+
+def _run_examinator(run: AssessmentRun):
+    if not run.options.cascade:
+        return _examine(run)
+
+    def reasons(verdict) -> list[str]:
+        return ["low_confidence"] if low_confidence(verdict) else []
+
+    # ブランチの不一致はLLM呼び出し前に分かるため、小型モデルを経ずに強いモデルで実行
+    known = ["matcher_disagreement"] if matcher_branches_disagree(run.outputs["matcher"]) else []
+    accepted = {}
+    result, escalated = run_cascade(
+        "examinator", lambda tier: _examine(run, tier), reasons, known_reasons=known, accepted_usage=accepted
+    )
+    if accepted:
+        run.accepted_small_usage["examinator"] = accepted
+    if escalated:
+        run.escalations["examinator"] = escalated
+    return result
+
+
+def _check(run: AssessmentRun, tier: Optional[str] = None):
+    return check_facts(
+        run.query_molecule,
+        run.patent_info,
+        run.is_protected,
+        _examinator_reasoning(run.outputs["examinator"]),
+        structured=run.options.use_structured,
+        tier=tier
+    )
+
+
+def _verify_and_report(run: AssessmentRun, tier: Optional[str] = None):
+    return verify_and_report(
+        run.query_molecule,
+        run.patent_info,
+        run.outputs["sketch"],
+        run.outputs["matcher"],
+        run.outputs["examinator"],
+        tier=tier
+    )
+
+
+def _fact_check_of(result):
+    """Fact Checkerステージの出力から事実検証結果を取り出す（融合モードではVerifiedReport）"""
+    return result.fact_check if isinstance(result, VerifiedReport) else result
+
+
+def _run_fact_checker(run: AssessmentRun):
+    check = _verify_and_report if run.options.fused else _check
+    if not run.options.cascade:
+        return check(run)
+
+    def reasons(result) -> list[str]:
+        verdict = _fact_check_of(result)
+        found = []
+        if low_confidence(verdict) or (isinstance(result, VerifiedReport) and low_confidence(result.report)):
+            found.append("low_confidence")
+        if not verdict.consistent:
+            found.append("fact_check_discrepancy")
+        return found
+
+    result, escalated = run_cascade("fact_checker", lambda tier: check(run, tier), reasons)
+    if escalated:
+        run.escalations["fact_checker"] = escalated
+
+    # 強いモデルでも不整合が残り、判定が小型モデル由来なら判定自体を昇格して再検証
+    if (
+        not _fact_check_of(result).consistent
+        and "examinator" not in run.escalations
+        and cascade_enabled("examinator")
+    ):
+        with track_usage() as strong:
+            run.outputs["examinator"] = _examine(run, STRONG_TIER)
+        CASCADE_STATS.record_late_escalation(
+            "examinator", strong, run.accepted_small_usage.pop("examinator", None)
+        )
+        run.escalations["examinator"] = ["fact_check_discrepancy"]
+        run.checkpoint("examinator")
+        # 昇格した判定での再検証は、全呼び出しを強いモデルで実行していれば不要だった追加の呼び出し
+        with track_usage() as recheck:
+            result = check(run, STRONG_TIER)
+        CASCADE_STATS.record_extra_strong("fact_checker", recheck)
+    return result
+
+
+def _plan(run: AssessmentRun, tier: Optional[str] = None):
+    return plan_and_coordinate(
+        run.query_molecule,
+        run.patent_info,
+        run.outputs["sketch"],
+        run.outputs["matcher"],
+        run.outputs["examinator"],
+        run.outputs["fact_checker"],
+        structured=run.options.use_structured,
+        tier=tier
+    )
+
+
+def _run_planner(run: AssessmentRun):
+    if run.options.fused:
+        # 融合モードではFact Checkerステージでレポートまで作成済み
+        return run.outputs["fact_checker"].report
+    if not run.options.cascade:
+        return _plan(run)
+
+    def reasons(report) -> list[str]:
+        return ["low_confidence"] if low_confidence(report) else []
+
+    known = [] if _fact_check_of(run.outputs["fact_checker"]).consistent else ["fact_check_discrepancy"]
+    result, escalated = run_cascade("planner", lambda tier: _plan(run, tier), reasons, known_reasons=known)
+    if escalated:
+        run.escalations["planner"] = escalated
+    return result
+
+
+STAGE_RUNNERS: dict[str, Callable[[AssessmentRun], Any]] = {
+    "sketch": _run_sketch,
+    "matcher": _run_matcher,
+    "examinator": _run_examinator,
+    "fact_checker": _run_fact_checker,
+    "planner": _run_planner,
+}
+
+
+def stage_prompts(run: AssessmentRun, stage: str) -> list[str]:
+    """LLMステージが送るプロンプト（_examine / _check / _verify_and_report / _planと同じ引数で描画）"""
+    sketch, matcher = run.outputs["sketch"], run.outputs["matcher"]
+    if stage == "examinator":
+        if run.options.per_group:
+            return [
+                group_prompt(sketch["core_markush_smiles"], run.query_molecule, group_id, group_value, requirement)
+                for group_id, group_value, requirement in group_inputs(matcher, sketch["claim_requirements"])
+            ]
+        return [examination_prompt(
+            sketch["core_markush_smiles"], run.query_molecule, matcher, run.patent_info, run.options.use_structured
+        )]
+    if stage == "fact_checker":
+        if run.options.fused:
+            return [verified_report_prompt(
+                run.query_molecule, run.patent_info, sketch, matcher, run.outputs["examinator"]
+            )]
+        return [fact_check_prompt(
+            run.query_molecule,
+            run.patent_info,
+            run.is_protected,
+            _examinator_reasoning(run.outputs["examinator"]),
+            run.options.use_structured
+        )]
+    return [report_prompt(
+        run.query_molecule,
+        run.patent_info,
+        sketch,
+        matcher,
+        run.outputs["examinator"],
+        run.outputs["fact_checker"],
+        run.options.use_structured
+    )]
+
+
+def stage_fingerprint(run: AssessmentRun, stage: str) -> str:
+    """ステージの入力を描画した文字列のハッシュ
+
+    - Sketch Extractor: クレームのみ（分子だけの変更では再実行しない）
+    - Substituents Matcher: クエリ分子とMarkush構造のコア・関連ブロック
+      （コアと関連ブロックが変わらないクレームの修正では再実行しない）
+    - LLMステージ: 実行オプション・設定（run_config）と、そのステージが送るプロンプト
+      （プロンプトに含まれない入力の変更では再実行しない）
+    """
+    if stage == "sketch":
+        inputs = [run.patent_info]
+    elif stage == "matcher":
+        sketch = run.outputs["sketch"]
+        inputs = [run.query_molecule, sketch.get("core_markush_smiles"), sketch.get("relevant_block_indices")]
+    elif stage == "planner" and run.options.fused:
+        # 融合モードではFact Checkerステージの出力からレポートを取り出すだけ
+        inputs = [encode_output(run.outputs["fact_checker"])]
+    else:
+        inputs = [asdict(run.options), run_config(), stage_prompts(run, stage)]
+        if run.options.cascade and stage == "examinator":
+            # ブランチの不一致はプロンプト外で強いモデルへの昇格を決める
+            inputs.append(matcher_branches_disagree(run.outputs["matcher"]))
+        if run.options.cascade and stage == "fact_checker":
+            # 不整合時に判定を昇格して再評価するかは、判定の入力と昇格の有無で決まる
+            inputs += [run.fingerprints.get("examinator"), "examinator" in run.escalations]
+    return hashlib.sha256(format_json([stage, inputs]).encode("utf-8")).hexdigest()
+
+
+def _reusable(run: AssessmentRun, stage: str, previous: Optional[AssessmentRun]) -> bool:
+    return (
+        previous is not None
+        and stage in previous.outputs
+        and previous.fingerprints.get(stage) == run.fingerprints[stage]
+    )
+
+
+def run_stage(run: AssessmentRun, stage: str, previous: Optional[AssessmentRun] = None) -> Any:
+    """1ステージを実行し、出力と所要時間をrunに記録（チェックポイント有効時は永続化）
+
+    ステージはrunのトークンの子トークン（STAGE_TIMEOUT_SEC）のもとで実行される。
+    previousを指定した場合、入力のフィンガープリントが前回と同一なら再実行せずに前回の出力を再利用し、
+    短縮した時間をrun.reusedに記録する。
+
+    Raises:
+        AssessmentCancelled: キャンセルされた、または評価・ステージの期限を超過した場合
+    """
+    start = time.perf_counter()
+    run.fingerprints[stage] = stage_fingerprint(run, stage)
+    if _reusable(run, stage, previous):
+        output = previous.outputs[stage]
+        run.reused[stage] = previous.reused.get(stage, previous.timings.get(stage, 0.0))
+        if stage in previous.escalations:
+            run.escalations[stage] = previous.escalations[stage]
+    else:
+        with use_token(run.token.child(STAGE_TIMEOUT_SEC or None)) as token:
+            token.check()
+            output = STAGE_RUNNERS[stage](run)
+    run.outputs[stage] = output
+    run.timings[stage] = time.perf_counter() - start
+    run.checkpoint(stage)
+    return run.outputs[stage]
+
+
+def load_run(
+    run_id: str,
+    checkpoints: CheckpointStore,
+    token: Optional[CancellationToken] = None
+) -> AssessmentRun:
+    """チェックポイントから評価を復元（最初の欠落ステージ以降は未実行の状態）"""
+    meta = checkpoints.load_meta(run_id)
+    run = AssessmentRun(
+        meta["query_molecule"],
+        meta["patent_info"],
+        PipelineOptions(**meta["options"]),
+        escalations=meta.get("escalations", {}),
+        fingerprints=meta.get("fingerprints", {}),
+        reused=meta.get("reused", {}),
+        run_id=run_id,
+        checkpoints=checkpoints,
+        token=token or new_assessment_token()
+    )
+    for stage, (output, elapsed) in checkpoints.load_stages(run_id, STAGES).items():
+        run.outputs[stage] = output
+        run.timings[stage] = elapsed
+    return run
+
+
+def start_run(
+    query_molecule: str,
+    patent_info: str,
+    options: Optional[PipelineOptions] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    run_id: Optional[str] = None,
+    token: Optional[CancellationToken] = None
+) -> AssessmentRun:
+    """評価を開始（同じ実行IDのチェックポイントがあればそこから再開）"""
+    if checkpoints is not None and run_id is not None and checkpoints.exists(run_id):
+        return load_run(run_id, checkpoints, token)
+    run = AssessmentRun(
+        query_molecule,
+        patent_info,
+        options or PipelineOptions(),
+        run_id=run_id or new_run_id(),
+        checkpoints=checkpoints,
+        token=token or new_assessment_token()
+    )
+    run.checkpoint()
+    return run
+
+
+def complete_run(run: AssessmentRun, previous: Optional[AssessmentRun] = None) -> AssessmentRun:
+    """未完了のステージを最初の欠落から順に実行（previousと入力が同一のステージは再利用）
+
+    キャンセル・タイムアウトした場合は例外を送出せず、run.abortedに中断したステージと理由を
+    記録して完了済みのステージまでの部分的な結果を返す。
+    """
+    while (stage := run.next_stage) is not None:
+        try:
+            run_stage(run, stage, previous)
+        except AssessmentCancelled as e:
+            run.aborted = {"stage": stage, "reason": str(e)}
+            break
+    return run
+
+
+def run_assessment(
+    query_molecule: str,
+    patent_info: str,
+    options: Optional[PipelineOptions] = None,
+    checkpoints: Optional[CheckpointStore] = None,
+    run_id: Optional[str] = None,
+    token: Optional[CancellationToken] = None,
+    previous: Optional[AssessmentRun] = None,
+    fresh: bool = False
+) -> AssessmentRun:
+    """全ステージを順に実行
+
+    チェックポイントを指定し実行IDを省略した場合は入力・オプション・設定から決まる実行ID
+    （assessment_run_id）を使い、同じ入力の完了済みステージは再実行しない。
+    freshをTrueにすると、その実行IDのチェックポイントを破棄して最初から実行する。
+    previous（前回の評価）を指定した場合は、入力が同一のステージの出力を再利用する。
+    """
+    options = options or PipelineOptions()
+    if checkpoints is not None and run_id is None:
+        run_id = assessment_run_id(query_molecule, patent_info, options)
+    if checkpoints is not None and fresh:
+        checkpoints.delete(run_id)
+    return complete_run(start_run(query_molecule, patent_info, options, checkpoints, run_id, token), previous)
+
+
+def resume_assessment(
+    run_id: str,
+    checkpoints: CheckpointStore,
+    token: Optional[CancellationToken] = None
+) -> AssessmentRun:
+    """チェックポイントから評価を再開し、残りのステージを実行"""
+    return complete_run(load_run(run_id, checkpoints, token))
@@ -0,0 +1,237 @@
+"""化合物ライブラリのスクリーニング - 1つのMarkushクレームに対して大量のSMILESを照合
+
+- .smi / CSVファイルをチャンク単位でストリーミング読み込み（メモリ使用量はライブラリサイズに依存しない）
+- 骨格マッチングとR基抽出をプロセスプールで並列実行
+- ヒットは入力順にCSVへ逐次書き出し、処理済みオフセットと出力ファイルのバイト位置を進捗ファイルに記録
+- 中断後は進捗ファイルのオフセットから再開（出力ファイルは記録したバイト位置まで切り詰めてから追記）
+
+使い方:
+    python screening.py library.smi --claim claim.txt --output hits.csv [--resume]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from agents.sketch_extractor import extract_markush_structure
+from agents.substituents_matcher import rdkit_substructure_match
+
+SCREENING_CHUNK_SIZE = int(os.getenv("SCREENING_CHUNK_SIZE") or 1000)
+# 未設定・空の場合はCPUコア数
+SCREENING_WORKERS = int(os.getenv("SCREENING_WORKERS") or os.cpu_count() or 1)
+
+HIT_FIELDS = ["offset", "compound_id", "smiles", "r_group_mapping"]
+
+# (オフセット, 化合物ID, SMILES)
+Record = tuple[int, str, str]
+
+
+@dataclass
+class ScreeningProgress:
+    """スクリーニングの進捗"""
+    processed: int = 0
+    hits: int = 0
+    offset: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """1秒あたりの処理化合物数"""
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+
+def read_library(path: str, start: int = 0) -> Iterator[Record]:
+    """ライブラリファイルから化合物を1件ずつ読み込む
+
+    .smiは「SMILES [ID]」形式、CSVは"smiles"列（IDは"id"または"name"列）を読む。
+    オフセットは空行・コメント行を除いた化合物の通し番号。
+
+    Args:
+        path: .smi / .csvファイルのパス
+        start: このオフセットより前の化合物を読み飛ばす
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        if Path(path).suffix.lower() == ".csv":
+            rows = (
+                (row["smiles"], row.get("id") or row.get("name") or "")
+                for row in csv.DictReader(f)
+                if row.get("smiles")
+            )
+        else:
+            rows = (
+                (parts[0], parts[1] if len(parts) > 1 else "")
+                for parts in (line.split(maxsplit=1) for line in f)
+                if parts and not parts[0].startswith("#")
+            )
+        for offset, (smiles, compound_id) in enumerate(rows):
+            if offset >= start:
+                yield offset, compound_id.strip() or str(offset), smiles
+
+
+def _chunks(records: Iterator[Record], size: int) -> Iterator[list[Record]]:
+    while chunk := list(islice(records, size)):
+        yield chunk
+
+
+def screen_chunk(chunk: list[Record], markush_structure: dict) -> list[dict]:
+    """チャンク内の化合物に骨格マッチングとR基抽出を行い、ヒットのみ返す（ワーカープロセスで実行）"""
+    hits = []
+    for offset, compound_id, smiles in chunk:
+        match = rdkit_substructure_match(smiles, markush_structure)
+        mapping = match.get("r_group_mapping", {})
+        if not match.get("skeleton_match") or "unknown" in mapping.values():
+            continue
+        hits.append({
+            "offset": offset,
+            "compound_id": compound_id,
+            "smiles": smiles,
+            "r_group_mapping": json.dumps(mapping, sort_keys=True),
+        })
+    return hits
+
+
+def _progress_path(output_path: str) -> Path:
+    return Path(f"{output_path}.progress")
+
+
+def read_resume_state(output_path: str) -> Optional[tuple[int, int]]:
+    """進捗ファイルから(再開オフセット, 出力ファイルの書き出し済みバイト数)を取得（なければNone）"""
+    path = _progress_path(output_path)
+    if not path.exists():
+        return None
+    state = json.loads(path.read_text())
+    return state["offset"], state["output_bytes"]
+
+
+def _write_resume_state(output_path: str, offset: int, output_bytes: int) -> None:
+    path = _progress_path(output_path)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"offset": offset, "output_bytes": output_bytes}))
+    os.replace(tmp, path)
+
+
+def _open_output(output_path: str, resume: bool) -> tuple[object, int]:
+    """出力ファイルを開き、(ファイル, 再開オフセット)を返す
+
+    再開時は、進捗ファイルに記録したバイト位置より後ろ（書き出し途中で中断したヒット）を切り詰めて追記する。
+
+    Raises:
+        FileNotFoundError: 進捗ファイルがあるのに出力ファイルがない場合（再開するとヒットが欠落するため）
+    """
+    state = read_resume_state(output_path) if resume else None
+    if state is None:
+        return open(output_path, "w", newline="", encoding="utf-8"), 0
+    offset, output_bytes = state
+    if not Path(output_path).exists():
+        raise FileNotFoundError(
+            f"{output_path} が見つかりません。オフセット{offset}より前のヒットが失われるため再開できません"
+            f"（最初からやり直す場合は --resume を外してください）"
+        )
+    with open(output_path, "r+b") as f:
+        f.truncate(output_bytes)
+    return open(output_path, "a", newline="", encoding="utf-8"), offset
+
+
+def screen_library(
+    library_path: str,
+    claim_text: str,
+    output_path: str,
+    chunk_size: int = SCREENING_CHUNK_SIZE,
+    workers: int = SCREENING_WORKERS,
+    resume: bool = False,
+    on_progress: Optional[Callable[[ScreeningProgress], None]] = None
+) -> ScreeningProgress:
+    """ライブラリ全体をスクリーニングし、ヒットをCSVに書き出す
+
+    実行中のチャンク数はworkers * 2に制限し、完了したチャンクは入力順に書き出す。
+    これにより、進捗ファイルのオフセットより前のヒットは全て出力済みであることが保証される。
+
+    Args:
+        library_path: .smi / .csvファイルのパス
+        claim_text: 特許クレームテキスト
+        output_path: ヒットを書き出すCSVファイルのパス
+        chunk_size: 1タスクあたりの化合物数
+        workers: ワーカープロセス数
+        resume: Trueの場合、進捗ファイルのオフセットから再開して追記（進捗ファイルがなければ最初から）
+        on_progress: チャンクを書き出すたびに呼ばれるコールバック
+
+    Returns:
+        最終的な進捗
+    """
+    markush_structure = extract_markush_structure(claim_text)
+    out, start = _open_output(output_path, resume)
+    progress = ScreeningProgress(offset=start)
+    began = time.perf_counter()
+
+    with out, ProcessPoolExecutor(max_workers=workers) as executor:
+        writer = csv.DictWriter(out, fieldnames=HIT_FIELDS)
+        if start == 0:
+            writer.writeheader()
+        in_flight = deque()
+
+        def drain_oldest():
+            chunk_end, future = in_flight.popleft()
+            hits = future.result()
+            writer.writerows(hits)
+            # ヒットを確実に書き出してから、そのバイト位置とオフセットを記録する
+            out.flush()
+            os.fsync(out.fileno())
+            progress.processed += chunk_end - progress.offset
+            progress.hits += len(hits)
+            progress.offset = chunk_end
+            progress.elapsed = time.perf_counter() - began
+            _write_resume_state(output_path, chunk_end, out.tell())
+            if on_progress:
+                on_progress(progress)
+
+        for chunk in _chunks(read_library(library_path, start), chunk_size):
+            in_flight.append((chunk[-1][0] + 1, executor.submit(screen_chunk, chunk, markush_structure)))
+            if len(in_flight) >= workers * 2:
+                drain_oldest()
+        while in_flight:
+            drain_oldest()
+
+    return progress
+
+
+def _print_progress(progress: ScreeningProgress) -> None:
+    print(
+        f"processed={progress.processed} hits={progress.hits} offset={progress.offset} "
+        f"throughput={progress.throughput:.1f} mol/s",
+        file=sys.stderr
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Markushクレームに対する化合物ライブラリのスクリーニング")
+    parser.add_argument("library", help=".smi / .csv形式のライブラリファイル")
+    parser.add_argument("--claim", required=True, help="特許クレームテキストのファイル")
+    parser.add_argument("--output", required=True, help="ヒットを書き出すCSVファイル")
+    parser.add_argument("--chunk-size", type=int, default=SCREENING_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=SCREENING_WORKERS)
+    parser.add_argument("--resume", action="store_true", help="前回の進捗オフセットから再開")
+    args = parser.parse_args()
+
+    claim_text = Path(args.claim).read_text(encoding="utf-8")
+    progress = screen_library(
+        args.library,
+        claim_text,
+        args.output,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        resume=args.resume,
+        on_progress=_print_progress
+    )
+    _print_progress(progress)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""シリーズ評価 - 同じ特許に対する類縁体シリーズをまとめて評価
+
+Sketch Extractorは特許ごとに1回だけ実行し、各分子のSubstituents Matcherの結果を
+Requirements Examinatorのバッチ評価（examine_requirements_batch）にまとめて渡す。
+"""
+from dataclasses import dataclass
+
+from agents import (
+    ExaminationVerdict,
+    extract_markush_structure,
+    match_substituents,
+    examine_requirements_batch
+)
+
+
+@dataclass
+class SeriesResult:
+    """シリーズ内の1分子分の評価結果"""
+    query_molecule: str
+    matcher_result: dict
+    verdict: ExaminationVerdict
+
+
+def assess_series(molecules: list[str], patent_info: str) -> list[SeriesResult]:
+    """複数の分子を同じ特許に対してバッチ評価
+
+    Args:
+        molecules: クエリ分子のSMILES文字列のリスト
+        patent_info: 特許クレームテキスト
+
+    Returns:
+        入力と同じ順序の分子ごとの評価結果
+    """
+    sketch_result = extract_markush_structure(patent_info)
+    matcher_results = [match_substituents(molecule, sketch_result) for molecule in molecules]
+    verdicts = examine_requirements_batch(
+        sketch_result["core_markush_smiles"],
+        list(zip(molecules, matcher_results)),
+        patent_info
+    )
+    return [
+        SeriesResult(molecule, matcher_result, verdict)
+        for molecule, matcher_result, verdict in zip(molecules, matcher_results, verdicts)
+    ]
+
+
+def series_table(results: list[SeriesResult]) -> list[dict]:
+    """評価結果を表（辞書リスト）に変換"""
+    return [
+        {
+            "query_molecule": result.query_molecule,
+            "verdict": result.verdict.overall,
+            "confidence": result.verdict.confidence,
+            "failed_groups": ", ".join(g.group_id for g in result.verdict.groups if not g.satisfied),
+        }
+        for result in results
+    ]
@@ -0,0 +1,21 @@
+"""テスト共通設定 - app/をインポートルートにし、LLMを遅延なしの疑似モデルに置き換える"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+
+
+@pytest.fixture(autouse=True)
+def fake_model():
+    from agents.cache import NullCache, use_cache
+    from agents.fake_model import FakeModel
+    from agents.llm import use_fake_model
+
+    model = FakeModel(latency=0.0, jitter=0.0)
+    use_fake_model(model)
+    use_cache(NullCache())
+    yield model
+    use_fake_model(None)
+    use_cache(None)
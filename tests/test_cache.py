@@ -0,0 +1,68 @@
+"""レプリカ間の共有キャッシュ（SQLiteバックエンド）"""
+import time
+
+import pytest
+
+from agents.cache import SQLiteCache
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+def test_entry_expires_after_ttl(cache_path):
+    cache = SQLiteCache(cache_path, ttl=3600)
+    cache.set("short", "value", ttl=0.01)
+    cache.set("long", "value")
+
+    time.sleep(0.02)
+
+    assert cache.get("short") is None
+    assert cache.get("long") == "value"
+
+
+def test_eviction_uses_buffered_access_time(cache_path):
+    # 1件約36バイトのため、上限80バイトでは2件まで残る
+    cache = SQLiteCache(cache_path, max_bytes=80, flush_interval=3600)
+    cache.set("k1", "value")
+    time.sleep(0.01)
+    cache.set("k2", "value")
+    time.sleep(0.01)
+    # DBへ未反映のアクセスも削除前に反映され、k1は最近使われた扱いになる
+    assert cache.get("k1") == "value"
+
+    cache.set("k3", "value")
+
+    assert cache.get("k1") == "value"
+    assert cache.get("k2") is None
+    assert cache.get("k3") == "value"
+
+
+def test_stats_per_replica_with_shared_hits(cache_path):
+    writer = SQLiteCache(cache_path, replica_id="a", flush_interval=3600)
+    reader = SQLiteCache(cache_path, replica_id="b", flush_interval=3600)
+    writer.set("key", {"x": 1})
+
+    assert writer.get("key") == {"x": 1}
+    assert reader.get("key") == {"x": 1}
+    assert reader.get("missing") is None
+
+    stats = {row["replica"]: row for row in reader.stats() + writer.stats()}
+    # 自分が書き込んだエントリへのヒットは共有ヒットに含めない
+    assert (stats["a"]["hits"], stats["a"]["shared_hits"], stats["a"]["misses"]) == (1, 0, 0)
+    assert (stats["b"]["hits"], stats["b"]["shared_hits"], stats["b"]["misses"]) == (1, 1, 1)
+    assert stats["b"]["hit_ratio"] == 0.5
+
+
+def test_get_or_compute_computes_once(cache_path):
+    cache = SQLiteCache(cache_path)
+    calls = []
+
+    def compute():
+        calls.append(True)
+        return ["result"]
+
+    assert cache.get_or_compute("key", compute) == ["result"]
+    assert cache.get_or_compute("key", compute) == ["result"]
+    assert len(calls) == 1
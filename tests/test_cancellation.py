@@ -0,0 +1,85 @@
+"""キャンセルトークンと期限の伝搬"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from agents.cancellation import (
+    AssessmentCancelled,
+    CancellationToken,
+    DeadlineExceeded,
+    check_cancelled,
+    current_token,
+    submit_with_context,
+    use_token,
+)
+
+
+def test_deadline_exceeded():
+    token = CancellationToken(timeout=0.01)
+    token.check()
+    time.sleep(0.02)
+
+    with pytest.raises(DeadlineExceeded):
+        token.check()
+    # 期限切れはキャンセル要求とは区別する
+    assert not token.cancelled
+
+
+def test_child_inherits_parent_cancellation_and_deadline():
+    parent = CancellationToken(timeout=10)
+    child = parent.child(timeout=60)
+    sibling = parent.child()
+
+    assert child.deadline == parent.deadline
+    child.cancel("early stop")
+    assert child.cancelled and not parent.cancelled and not sibling.cancelled
+
+    parent.cancel("stopped")
+    with pytest.raises(AssessmentCancelled, match="stopped"):
+        sibling.check()
+
+
+def test_child_deadline_shorter_than_parent():
+    parent = CancellationToken()
+    child = parent.child(timeout=0.0)
+
+    with pytest.raises(DeadlineExceeded):
+        child.check()
+    parent.check()
+
+
+def test_cancel_when_is_polled_on_check():
+    abandoned = []
+    token = CancellationToken(cancel_when=lambda: bool(abandoned))
+    child = token.child()
+    child.check()
+
+    abandoned.append(True)
+
+    with pytest.raises(AssessmentCancelled, match="abandoned"):
+        child.check()
+    assert token.cancelled
+
+
+def test_check_cancelled_uses_current_token():
+    check_cancelled()
+    token = CancellationToken()
+    token.cancel()
+
+    with use_token(token):
+        assert current_token() is token
+        with pytest.raises(AssessmentCancelled):
+            check_cancelled()
+    assert current_token() is None
+
+
+def test_submit_with_context_carries_token_to_worker():
+    token = CancellationToken()
+
+    with use_token(token), ThreadPoolExecutor(max_workers=1) as executor:
+        carried = submit_with_context(executor, current_token).result()
+        plain = executor.submit(current_token).result()
+
+    assert carried is token
+    assert plain is None
@@ -0,0 +1,165 @@
+"""モデルカスケードの昇格判定と統計"""
+import pytest
+
+from agents.cascade import (
+    MODEL_COST_PER_1K_TOKENS,
+    SMALL_TIER,
+    STRONG_TIER,
+    CascadeStats,
+    matcher_branches_disagree,
+    run_cascade
+)
+from agents.sketch_extractor import extract_markush_structure
+from agents.substituents_matcher import match_substituents
+from sample_data import SAMPLE_PATENT_CLAIM, SAMPLE_PROTECTED_MOLECULE, SAMPLE_QUERY_MOLECULE
+
+
+def _usage(latency: float, tokens: int = 1000) -> dict:
+    return {"input_tokens": tokens, "output_tokens": 0, "latency": latency}
+
+
+def _stage(stats: CascadeStats, stage: str = "examinator") -> dict:
+    return next(row for row in stats.summary() if row["stage"] == stage)
+
+
+@pytest.fixture(autouse=True)
+def distinct_tiers(monkeypatch):
+    monkeypatch.setenv("SMALL_MODEL_ID", "small-model")
+    monkeypatch.setenv("STRONG_MODEL_ID", "strong-model")
+
+
+def test_accepted_small_call_saves_strong_cost():
+    stats = CascadeStats()
+    stats.record("examinator", small=_usage(1.0))
+
+    row = _stage(stats)
+    assert row["escalations"] == 0
+    assert row["cost_saved_usd"] == pytest.approx(
+        MODEL_COST_PER_1K_TOKENS[STRONG_TIER] - MODEL_COST_PER_1K_TOKENS[SMALL_TIER]
+    )
+
+
+def test_late_escalation_takes_back_avoided_cost():
+    stats = CascadeStats()
+    small = _usage(1.0)
+    stats.record("examinator", small=small)
+    stats.record_late_escalation("examinator", _usage(3.0), accepted_small=small)
+
+    row = _stage(stats)
+    # 両方のモデルの費用を支払ったため、小型モデルの分だけ損失になる
+    assert row["calls"] == 1
+    assert row["escalations"] == 1
+    assert row["cost_saved_usd"] == pytest.approx(-MODEL_COST_PER_1K_TOKENS[SMALL_TIER])
+    assert row["latency_saved_sec"] == pytest.approx(3.0 - 4.0)
+
+
+def test_late_escalation_of_restored_result_counts_as_strong_call():
+    stats = CascadeStats()
+    stats.record_late_escalation("examinator", _usage(3.0))
+
+    row = _stage(stats)
+    assert (row["calls"], row["escalations"], row["cost_saved_usd"]) == (1, 1, 0.0)
+
+
+def test_extra_strong_call_is_a_loss():
+    stats = CascadeStats()
+    stats.record("fact_checker", small=_usage(1.0), strong=_usage(3.0))
+    stats.record_extra_strong("fact_checker", _usage(3.0))
+
+    row = _stage(stats, "fact_checker")
+    assert row["calls"] == 1
+    assert row["cost_saved_usd"] == pytest.approx(
+        -MODEL_COST_PER_1K_TOKENS[SMALL_TIER] - MODEL_COST_PER_1K_TOKENS[STRONG_TIER]
+    )
+    assert row["latency_saved_sec"] == pytest.approx(3.0 - 7.0)
+
+
+def test_latency_is_estimated_until_strong_call_observed(monkeypatch):
+    monkeypatch.setattr("agents.cascade.CASCADE_STRONG_LATENCY_RATIO", 3.0)
+    stats = CascadeStats()
+    stats.record("examinator", small=_usage(1.0))
+
+    row = _stage(stats)
+    assert row["latency_estimated"]
+    assert row["latency_saved_sec"] == pytest.approx(2.0)
+
+    stats.record("examinator", small=_usage(1.0), strong=_usage(5.0))
+    row = _stage(stats)
+    assert not row["latency_estimated"]
+    assert row["latency_saved_sec"] == pytest.approx(2 * 5.0 - 7.0)
+
+
+def test_run_cascade_escalates_on_reasons():
+    stats = CascadeStats()
+    calls = []
+
+    result, reasons = run_cascade(
+        "examinator", lambda tier: calls.append(tier) or tier, lambda result: ["low_confidence"], stats
+    )
+
+    assert (result, reasons, calls) == (STRONG_TIER, ["low_confidence"], [SMALL_TIER, STRONG_TIER])
+
+
+def test_run_cascade_reports_accepted_usage():
+    stats = CascadeStats()
+    accepted = {}
+
+    result, reasons = run_cascade("examinator", lambda tier: tier, lambda result: [], stats, accepted_usage=accepted)
+
+    assert (result, reasons) == (SMALL_TIER, [])
+    assert set(accepted) >= {"input_tokens", "output_tokens", "latency"}
+
+
+def test_run_cascade_known_reasons_skip_small_tier():
+    stats = CascadeStats()
+    calls = []
+
+    result, reasons = run_cascade(
+        "examinator",
+        lambda tier: calls.append(tier) or tier,
+        lambda result: [],
+        stats,
+        known_reasons=["matcher_disagreement"]
+    )
+
+    assert (result, reasons, calls) == (STRONG_TIER, ["matcher_disagreement"], [STRONG_TIER])
+    assert _stage(stats)["escalations"] == 1
+
+
+def test_run_cascade_disabled_for_identical_tiers(monkeypatch):
+    monkeypatch.setenv("STRONG_MODEL_ID", "small-model")
+    stats = CascadeStats()
+    calls = []
+
+    with pytest.warns(UserWarning, match="カスケードを無効"):
+        result, reasons = run_cascade("identical_tiers", lambda tier: calls.append(tier) or tier, lambda r: ["x"], stats)
+
+    assert (result, reasons, calls) == (STRONG_TIER, [], [STRONG_TIER])
+    assert stats.summary() == []
+
+
+def _matcher_result(query_molecule: str) -> dict:
+    return match_substituents(query_molecule, extract_markush_structure(SAMPLE_PATENT_CLAIM))
+
+
+def test_matcher_branches_agree_for_known_substituents():
+    assert not matcher_branches_disagree(_matcher_result(SAMPLE_QUERY_MOLECULE))
+    assert not matcher_branches_disagree(_matcher_result(SAMPLE_PROTECTED_MOLECULE))
+
+
+def test_matcher_branches_disagree_on_unknown_substituent():
+    assert matcher_branches_disagree(_matcher_result("CCO"))
+
+
+def test_matcher_disagreement_uses_flag_not_label():
+    result = _matcher_result("CCO")
+    for item in result["substituent_analysis"]:
+        item["branches_agree"] = True
+        item["match_status"] = "表示用の任意の説明"
+
+    assert not matcher_branches_disagree(result)
+    result["substituent_analysis"][0].pop("branches_agree")
+    assert matcher_branches_disagree(result)
+    result["substituent_analysis"][0]["branches_agree"] = True
+    result["nn_result"]["skeleton_match"] = False
+    assert matcher_branches_disagree(result)
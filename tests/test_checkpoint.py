@@ -0,0 +1,64 @@
+"""チェックポイントの保存・読み込みと保持期間"""
+import os
+import time
+
+from checkpoint import CheckpointStore
+
+
+def _save(store: CheckpointStore, run_id: str, age: float = 0.0) -> None:
+    store.save_meta(run_id, {"query_molecule": run_id})
+    if age:
+        meta = store.root / run_id / "meta.json"
+        updated = time.time() - age
+        os.utime(meta, (updated, updated))
+
+
+def test_load_stages_stops_at_first_missing(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    _save(store, "run")
+    store.save_stage("run", "sketch", {"core": "*C*"}, 1.0)
+    store.save_stage("run", "examinator", "text", 2.0)
+
+    assert store.load_stages("run", ("sketch", "matcher", "examinator")) == {"sketch": ({"core": "*C*"}, 1.0)}
+
+
+def test_prune_keeps_newest_runs(tmp_path):
+    store = CheckpointStore(str(tmp_path), ttl=0, max_runs=2)
+    _save(store, "old", age=30)
+    _save(store, "middle", age=20)
+
+    _save(store, "new")
+
+    assert store.list_runs() == ["middle", "new"]
+
+
+def test_prune_removes_expired_runs(tmp_path):
+    store = CheckpointStore(str(tmp_path), ttl=60, max_runs=0)
+    _save(store, "expired", age=120)
+    _save(store, "recent", age=10)
+
+    _save(store, "new")
+
+    assert store.list_runs() == ["new", "recent"]
+
+
+def test_updating_existing_run_does_not_prune(tmp_path):
+    store = CheckpointStore(str(tmp_path), ttl=0, max_runs=1)
+    _save(store, "first")
+    store.max_runs = 0
+    _save(store, "second")
+    store.max_runs = 1
+
+    # 既存の実行のメタデータ更新では削除しない
+    _save(store, "first")
+
+    assert store.list_runs() == ["first", "second"]
+
+
+def test_delete(tmp_path):
+    store = CheckpointStore(str(tmp_path))
+    _save(store, "run")
+
+    store.delete("run")
+
+    assert not store.exists("run")
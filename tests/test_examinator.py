@@ -0,0 +1,109 @@
+"""Requirements Examinatorのバッチ分割と個別評価へのフォールバック"""
+import pytest
+
+# LLMエージェント（planner / examinator / fact_checker）はstrandsに依存する
+pytest.importorskip("strands")
+
+from pydantic import ValidationError
+
+from agents import examinator
+from agents.cancellation import AssessmentCancelled
+from agents.examinator import examine_requirements_batch, plan_batches
+from agents.verdicts import ExaminationVerdict
+
+MARKUSH = "c1ccc([R1])cc1"
+CLAIM = "R1 is H or CH3"
+ITEMS = [(f"c1ccc(C{'C' * i})cc1", {"r_group_mapping": {"R[1]": "C" * (i + 1)}}) for i in range(6)]
+
+
+def _verdict(index: int) -> ExaminationVerdict:
+    return ExaminationVerdict(groups=[], overall="NOT_PROTECTED", confidence=0.5, evidence=[f"Claim {index}"])
+
+
+def test_plan_batches_single_batch_within_budget():
+    assert plan_batches(MARKUSH, ITEMS, CLAIM) == [list(range(len(ITEMS)))]
+
+
+def test_plan_batches_caps_items_by_output_budget(monkeypatch):
+    monkeypatch.setattr(examinator, "BATCH_MAX_OUTPUT_TOKENS", examinator.BATCH_OUTPUT_TOKENS_PER_ITEM * 4)
+
+    assert plan_batches(MARKUSH, ITEMS, CLAIM) == [[0, 1, 2, 3], [4, 5]]
+
+
+def test_plan_batches_splits_by_input_budget(monkeypatch):
+    shared = examinator.estimate_tokens(examinator.EXAMINATOR_PROMPT + MARKUSH + CLAIM)
+    item = examinator.estimate_tokens(examinator._batch_item_text(0, *ITEMS[0]))
+    # 共通部分の後に分子2個分だけ入る予算
+    monkeypatch.setattr(examinator, "BATCH_INPUT_TOKEN_BUDGET", shared + 2 * item + 1)
+
+    batches = plan_batches(MARKUSH, ITEMS, CLAIM)
+
+    assert [index for batch in batches for index in batch] == list(range(len(ITEMS)))
+    assert all(1 <= len(batch) <= 2 for batch in batches)
+
+
+def test_plan_batches_keeps_oversized_item_alone(monkeypatch):
+    # 予算を超える分子も空のバッチには1件入れる
+    monkeypatch.setattr(examinator, "BATCH_INPUT_TOKEN_BUDGET", 0)
+
+    assert plan_batches(MARKUSH, ITEMS, CLAIM) == [[index] for index in range(len(ITEMS))]
+
+
+@pytest.fixture
+def individual(monkeypatch):
+    """個別評価に回された分子のSMILESを記録する"""
+    calls = []
+
+    def examine(markush_string, molecule_string, match_result, claim_text, structured=False, tier=None):
+        calls.append(molecule_string)
+        return _verdict(-1)
+
+    monkeypatch.setattr(examinator, "examine_requirements", examine)
+    return calls
+
+
+def test_batch_failure_falls_back_per_molecule(monkeypatch, individual):
+    monkeypatch.setattr(examinator, "BATCH_MAX_OUTPUT_TOKENS", examinator.BATCH_OUTPUT_TOKENS_PER_ITEM * 4)
+
+    def examine_batch(markush_string, items, indices, claim_text, tier):
+        if indices[0] == 0:
+            raise ValidationError.from_exception_data("BatchExaminationVerdict", [])
+        return {index: _verdict(index) for index in indices}
+
+    monkeypatch.setattr(examinator, "_examine_batch", examine_batch)
+
+    verdicts = examine_requirements_batch(MARKUSH, ITEMS, CLAIM)
+
+    # 解析に失敗したバッチの分子のみ個別に再評価し、入力と同じ順序で返す
+    assert individual == [molecule for molecule, _ in ITEMS[:4]]
+    assert [verdict.evidence for verdict in verdicts] == [["Claim -1"]] * 4 + [["Claim 4"], ["Claim 5"]]
+
+
+def test_missing_batch_item_examined_individually(monkeypatch, individual):
+    monkeypatch.setattr(
+        examinator, "_examine_batch",
+        lambda markush_string, items, indices, claim_text, tier: {i: _verdict(i) for i in indices if i != 2},
+    )
+
+    verdicts = examine_requirements_batch(MARKUSH, ITEMS, CLAIM)
+
+    assert individual == [ITEMS[2][0]]
+    assert len(verdicts) == len(ITEMS)
+
+
+def test_cancellation_is_not_swallowed(monkeypatch, individual):
+    def cancelled(*args):
+        raise AssessmentCancelled("deadline")
+
+    monkeypatch.setattr(examinator, "_examine_batch", cancelled)
+
+    with pytest.raises(AssessmentCancelled):
+        examine_requirements_batch(MARKUSH, ITEMS, CLAIM)
+    assert individual == []
+
+
+def test_batch_with_fake_model_matches_input_order():
+    verdicts = examine_requirements_batch(MARKUSH, ITEMS, CLAIM)
+
+    assert len(verdicts) == len(ITEMS)
+    assert all(isinstance(verdict, ExaminationVerdict) for verdict in verdicts)
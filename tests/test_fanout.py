@@ -0,0 +1,76 @@
+"""複数特許ファンアウトと最初のPROTECTEDでの停止"""
+import threading
+
+import pytest
+
+# LLMエージェント（planner / examinator / fact_checker）はstrandsに依存する
+pytest.importorskip("strands")
+
+import fanout
+from checkpoint import CheckpointStore
+from fanout import FanoutResult, assess_patents, summary_table
+from pipeline import PipelineOptions, run_stage, start_run
+from sample_data import SAMPLE_PATENT_CLAIM, SAMPLE_PROTECTED_MOLECULE, SAMPLE_QUERY_MOLECULE
+
+PATENTS = {f"patent-{i}": f"{SAMPLE_PATENT_CLAIM}\n(patent {i})" for i in range(4)}
+
+
+def test_all_patents_completed_without_early_stop():
+    results = assess_patents(SAMPLE_QUERY_MOLECULE, PATENTS)
+
+    assert [result.status for result in results] == ["completed"] * len(PATENTS)
+    assert {result.verdict for result in results} == {"NOT_PROTECTED"}
+
+
+def test_stop_at_first_protected_cancels_remaining(monkeypatch):
+    # 1件ずつ処理し、最初の特許がPROTECTEDになった時点で残りは未着手のままキャンセルされる
+    monkeypatch.setattr(fanout, "FANOUT_LLM_WORKERS", 1)
+
+    results = assess_patents(SAMPLE_PROTECTED_MOLECULE, PATENTS, stop_at_first_protected=True)
+
+    statuses = sorted(result.status for result in results)
+    assert statuses == ["cancelled"] * (len(PATENTS) - 1) + ["completed"]
+    table = summary_table(results)
+    assert table[0]["verdict"] == "PROTECTED"
+    assert [row["verdict"] for row in table[1:]] == ["-"] * (len(PATENTS) - 1)
+
+
+def _prepared(patent_id: str, stages: tuple[str, ...]) -> FanoutResult:
+    run = start_run(SAMPLE_PROTECTED_MOLECULE, PATENTS[patent_id], PipelineOptions())
+    for stage in stages:
+        run_stage(run, stage)
+    return FanoutResult(patent_id, run)
+
+
+def test_known_protected_hit_is_not_cancelled():
+    first = _prepared("patent-0", ("sketch", "matcher"))
+    known = _prepared("patent-1", ("sketch", "matcher", "examinator"))
+    pending = _prepared("patent-2", ("sketch", "matcher"))
+
+    fanout._assess(first, [first, known, pending], True, threading.Lock())
+
+    assert first.status == "completed"
+    assert not known.run.token.cancelled
+    assert pending.run.token.cancelled
+
+
+def test_verdict_kept_when_report_cancelled():
+    result = _prepared("patent-0", ("sketch", "matcher", "examinator"))
+    result.status = "cancelled"
+
+    assert result.verdict == "PROTECTED (report cancelled)"
+    assert summary_table([_prepared("patent-1", ("sketch", "matcher")), result])[0]["patent_id"] == "patent-0"
+
+
+def test_fresh_fanout_ignores_checkpoints(tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path))
+    patents = {"patent-0": PATENTS["patent-0"]}
+    first = assess_patents(SAMPLE_QUERY_MOLECULE, patents, checkpoints=checkpoints)[0]
+    checkpoints.save_stage(first.run.run_id, "examinator", "## 最終判定\\nPROTECTED", 0.0)
+
+    cached = assess_patents(SAMPLE_QUERY_MOLECULE, patents, checkpoints=checkpoints)[0]
+    fresh = assess_patents(SAMPLE_QUERY_MOLECULE, patents, checkpoints=checkpoints, fresh=True)[0]
+
+    assert cached.run.run_id == fresh.run.run_id == first.run.run_id
+    assert cached.run.outputs["examinator"] == "## 最終判定\\nPROTECTED"
+    assert fresh.run.outputs["examinator"] != cached.run.outputs["examinator"]
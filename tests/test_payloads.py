@@ -0,0 +1,46 @@
+"""エージェント間ペイロードのシリアライズとトークン数の概算"""
+from agents.llm import estimate_tokens
+from agents.payloads import format_mapping, format_requirements, format_verdict, strip_translation, use_payload_format
+from agents.verdicts import ExaminationVerdict, GroupVerdict
+
+VERDICT = ExaminationVerdict(
+    groups=[GroupVerdict(group_id="B[5]", value="c1ccsc1", satisfied=True, reason="r")],
+    overall="PROTECTED",
+    confidence=0.9,
+    evidence=["Claim 1"],
+)
+
+
+def test_format_mapping_sorts_keys_and_normalizes_hydrogen():
+    assert format_mapping({"R[22]": " [H][H] ", "B[5]": "c1ccsc1"}) == '{"B5":"c1ccsc1","R22":"[H]"}'
+
+
+def test_format_requirements_strips_translation():
+    assert format_requirements({"R[21]": "H or CH3（HまたはCH3）"}) == '{"R21":"H or CH3"}'
+
+
+def test_strip_translation_keeps_japanese_only_text():
+    assert strip_translation("水素またはメチル（C1）") == "水素またはメチル（C1）"
+
+
+def test_format_verdict_omits_group_values():
+    assert format_verdict(VERDICT, omit_group_values=True) == (
+        '{"confidence":0.9,"evidence":["Claim 1"],'
+        '"groups":[{"group_id":"B5","reason":"r","satisfied":true}],"overall":"PROTECTED"}'
+    )
+
+
+def test_repr_format_restores_previous_payloads():
+    mapping = {"R[22]": " [H][H] "}
+
+    with use_payload_format("repr"):
+        assert format_mapping(mapping) == str(mapping)
+        assert format_verdict(VERDICT) == VERDICT.model_dump_json()
+    assert format_mapping(mapping) == '{"R22":"[H]"}'
+
+
+def test_estimate_tokens_counts_non_ascii_per_character():
+    assert estimate_tokens("c1ccccc1C") == 4
+    # 日本語は1文字で少なくとも1トークン
+    assert estimate_tokens("水素") == 3
+    assert estimate_tokens("H（水素）") > estimate_tokens("H(H)")
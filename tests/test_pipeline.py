@@ -0,0 +1,141 @@
+"""評価パイプライン（strandsのエージェントを疑似モデルで実行）"""
+import pytest
+
+# LLMエージェント（planner / examinator / fact_checker）はstrandsに依存する
+pytest.importorskip("strands")
+
+from agents.verdicts import InfringementReport
+from checkpoint import CheckpointStore
+from pipeline import STAGES, PipelineOptions, complete_run, load_run, new_assessment_token, run_assessment
+from sample_data import SAMPLE_PATENT_CLAIM, SAMPLE_PROTECTED_MOLECULE, SAMPLE_QUERY_MOLECULE
+
+
+@pytest.fixture
+def previous():
+    return run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM)
+
+
+@pytest.mark.parametrize(
+    ("query_molecule", "patent_info", "options", "reused"),
+    [
+        # 入力が同一なら全ステージを再利用
+        (SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, PipelineOptions(), list(STAGES)),
+        # 分子だけの変更ではSketch Extractorのみ再利用
+        (SAMPLE_PROTECTED_MOLECULE, SAMPLE_PATENT_CLAIM, PipelineOptions(), ["sketch"]),
+        # コア・関連ブロックが変わらないクレームの修正ではMatcherを再利用
+        # （Plannerのプロンプトはクレームの先頭2000文字のみを含むため、末尾の修正では同一になる）
+        (SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM + "\n", PipelineOptions(), ["matcher", "planner"]),
+        # 実行オプションの変更ではLLMステージのみ再実行
+        (SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, PipelineOptions(structured=True), ["sketch", "matcher"]),
+    ],
+    ids=["unchanged", "molecule", "claim_whitespace", "options"],
+)
+def test_reuse_matrix(previous, query_molecule, patent_info, options, reused):
+    run = run_assessment(query_molecule, patent_info, options, previous=previous)
+
+    assert run.completed
+    assert sorted(run.reused) == sorted(reused)
+    for stage in reused:
+        assert run.outputs[stage] is previous.outputs[stage]
+
+
+def test_reuse_per_group_when_prompts_exclude_claim():
+    options = PipelineOptions(per_group=True)
+    previous = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, options)
+
+    run = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM + " ", options, previous=previous)
+
+    # R基ごとの評価とレポート（構造化出力）のプロンプトはクレーム全文を含まないため再実行しない。
+    # クレーム全文を渡すSketch ExtractorとFact Checkerは再実行する
+    assert sorted(run.reused) == ["examinator", "matcher", "planner"]
+
+
+def test_reuse_skips_stage_missing_from_previous(previous):
+    del previous.outputs["planner"]
+
+    run = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, previous=previous)
+
+    assert run.completed
+    assert sorted(run.reused) == sorted(stage for stage in STAGES if stage != "planner")
+
+
+def test_reuse_carries_saved_time_across_generations(previous):
+    second = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, previous=previous)
+    third = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, previous=second)
+
+    # 短縮時間は再利用した時点の所要時間ではなく、最初に実行したときの所要時間
+    assert third.reused == second.reused
+    assert third.reused["sketch"] == previous.timings["sketch"]
+
+
+def test_checkpoint_resume_from_first_missing_stage(tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path))
+    finished = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints)
+    # fact_checkerの出力が失われた場合、それ以降に保存済みのplannerも読み込まない
+    (tmp_path / finished.run_id / "fact_checker.json").unlink()
+
+    run = load_run(finished.run_id, checkpoints)
+
+    assert list(run.outputs) == ["sketch", "matcher", "examinator"]
+    assert run.next_stage == "fact_checker"
+    complete_run(run)
+    assert run.completed
+    assert run.outputs["examinator"] == finished.outputs["examinator"]
+
+
+def _mark_report(checkpoints: CheckpointStore, run_id: str) -> None:
+    """保存済みのレポートを目印に置き換え、再利用されたかを判別できるようにする"""
+    marker = InfringementReport(groups=[], overall="INFRINGES", confidence=0.0, summary="checkpointed")
+    checkpoints.save_stage(run_id, "planner", marker, 0.0)
+
+
+def _reused_checkpoint(run) -> bool:
+    report = run.outputs["planner"]
+    return isinstance(report, InfringementReport) and report.summary == "checkpointed"
+
+
+def test_run_assessment_reuses_content_run_id(tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path))
+
+    first = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints)
+    _mark_report(checkpoints, first.run_id)
+    second = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints)
+    other = run_assessment(SAMPLE_PROTECTED_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints)
+
+    assert first.run_id == second.run_id != other.run_id
+    assert _reused_checkpoint(second)
+
+
+def test_model_change_gets_new_run_id(tmp_path, monkeypatch):
+    checkpoints = CheckpointStore(str(tmp_path))
+    first = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints)
+    _mark_report(checkpoints, first.run_id)
+
+    monkeypatch.setenv("PLANNER_MODEL_ID", "another-model")
+    second = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints)
+
+    assert second.run_id != first.run_id
+    assert not _reused_checkpoint(second)
+
+
+def test_fresh_run_discards_checkpoint(tmp_path):
+    checkpoints = CheckpointStore(str(tmp_path))
+    first = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints)
+    _mark_report(checkpoints, first.run_id)
+
+    second = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, checkpoints=checkpoints, fresh=True)
+
+    assert second.run_id == first.run_id
+    assert not _reused_checkpoint(second)
+    assert not _reused_checkpoint(load_run(first.run_id, checkpoints))
+
+
+def test_deadline_keeps_partial_outputs(fake_model):
+    # LLMの応答待ちの間に評価全体の期限が切れる
+    fake_model.latency = 1.0
+
+    run = run_assessment(SAMPLE_QUERY_MOLECULE, SAMPLE_PATENT_CLAIM, token=new_assessment_token(timeout=0.1))
+
+    assert not run.completed
+    assert run.aborted == {"stage": "examinator", "reason": "deadline exceeded"}
+    assert list(run.outputs) == ["sketch", "matcher"]
@@ -0,0 +1,74 @@
+"""化合物ライブラリのスクリーニングと中断からの再開"""
+import pytest
+
+from sample_data import SAMPLE_PATENT_CLAIM, SAMPLE_PROTECTED_MOLECULE, SAMPLE_QUERY_MOLECULE
+from screening import read_library, read_resume_state, screen_library
+
+# ヒット（チオフェン・ピリダジン）と非ヒットを交互に並べる
+LIBRARY = "\n".join(
+    ["# comment", ""]
+    + [f"{smiles} cpd{i}" for i, smiles in enumerate([SAMPLE_PROTECTED_MOLECULE, "CCO", SAMPLE_QUERY_MOLECULE] * 4)]
+) + "\n"
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def library(tmp_path):
+    path = tmp_path / "library.smi"
+    path.write_text(LIBRARY, encoding="utf-8")
+    return str(path)
+
+
+def _screen(library: str, output: str, **kwargs):
+    return screen_library(library, SAMPLE_PATENT_CLAIM, output, chunk_size=2, workers=1, **kwargs)
+
+
+def test_read_library_skips_comments_and_blank_lines(library):
+    records = list(read_library(library, start=10))
+
+    assert records == [(10, "cpd10", "CCO"), (11, "cpd11", SAMPLE_QUERY_MOLECULE)]
+
+
+def test_resume_after_crash_matches_uninterrupted_run(library, tmp_path):
+    expected_path = tmp_path / "expected.csv"
+    progress = _screen(library, str(expected_path))
+    assert (progress.processed, progress.hits) == (12, 8)
+
+    output = tmp_path / "hits.csv"
+
+    def crash_after_second_chunk(progress):
+        if progress.offset >= 4:
+            raise Interrupted
+
+    with pytest.raises(Interrupted):
+        _screen(library, str(output), on_progress=crash_after_second_chunk)
+    # 進捗の記録後に書きかけの行が残った状態を再現
+    with open(output, "a", encoding="utf-8") as f:
+        f.write("5,cpd5,c1cc")
+    assert read_resume_state(str(output))[0] == 4
+
+    resumed = _screen(library, str(output), resume=True)
+
+    assert resumed.processed == 8
+    assert output.read_bytes() == expected_path.read_bytes()
+
+
+def test_resume_refused_when_output_missing(library, tmp_path):
+    output = tmp_path / "hits.csv"
+    _screen(library, str(output))
+    output.unlink()
+
+    with pytest.raises(FileNotFoundError):
+        _screen(library, str(output), resume=True)
+
+
+def test_resume_without_progress_starts_over(library, tmp_path):
+    output = tmp_path / "hits.csv"
+
+    progress = _screen(library, str(output), resume=True)
+
+    assert progress.processed == 12
+    assert output.read_text(encoding="utf-8").startswith("offset,compound_id,smiles,r_group_mapping")
@@ -0,0 +1,40 @@
+"""R基ごとの評価結果の集約"""
+from agents.verdicts import GroupExamination, GroupVerdict, aggregate_group_examinations
+
+
+def _group(group_id: str, satisfied: bool, confidence: float, evidence: list[str]) -> GroupExamination:
+    return GroupExamination(
+        verdict=GroupVerdict(group_id=group_id, value="C", satisfied=satisfied, reason="r"),
+        confidence=confidence,
+        evidence=evidence,
+    )
+
+
+def test_all_satisfied_is_protected():
+    verdict = aggregate_group_examinations([
+        _group("R[1]", True, 0.9, ["Claim 2", "Claim 1"]),
+        _group("R[2]", True, 0.7, ["Claim 1"]),
+    ])
+
+    assert verdict.overall == "PROTECTED"
+    assert verdict.confidence == 0.7
+    assert verdict.evidence == ["Claim 1", "Claim 2"]
+    assert [group.group_id for group in verdict.groups] == ["R[1]", "R[2]"]
+
+
+def test_any_unsatisfied_is_not_protected():
+    verdict = aggregate_group_examinations([
+        _group("R[1]", True, 0.9, ["Claim 1"]),
+        _group("R[2]", False, 0.8, ["Claim 3"]),
+    ])
+
+    assert verdict.overall == "NOT_PROTECTED"
+    assert verdict.confidence == 0.8
+
+
+def test_empty_is_not_protected():
+    verdict = aggregate_group_examinations([])
+
+    assert verdict.overall == "NOT_PROTECTED"
+    assert verdict.confidence == 0.0
+    assert verdict.groups == [] and verdict.evidence == []